@@ -0,0 +1,52 @@
+# import-time benchmark: cumulative import time of the modules (python -X importtime, fresh interpreter per run)
+# and which heavy dependencies they load up front
+# run from the repository root: python benchmarks/bench_import.py [--repeat 5] [module ...]
+
+import sys
+import os
+import argparse
+import subprocess
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+heavy = ['scipy.signal', 'scipy.integrate', 'scipy.optimize', 'scipy.stats', 'matplotlib', 'colorednoise']
+
+def import_time(statement):
+    '''cumulative import time in s of all top-level imports of statement & the names of all imported modules'''
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                            capture_output=True, text=True, cwd=root, check=True)
+    seconds = 0
+    modules = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.add(name.strip())
+        if not name.startswith('  '):  # top-level entry, includes its nested imports
+            seconds += int(cumulative) / 1e6
+    return seconds, modules
+
+def best(statement, repeat):
+    '''best import time of repeat runs & the heavy dependencies statement loads'''
+    runs = [import_time(statement) for _ in range(repeat)]
+    loaded = [name for name in heavy if any(imported == name or imported.startswith(name + '.') for imported in runs[0][1])]
+    return min(run[0] for run in runs), loaded
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmark the import time of the modules')
+    parser.add_argument('modules', nargs='*', default=['numpy', 'nsd', 'nsd_helper', 'nsd_stream', 'nsd_io', 'nsd_cache'])
+    parser.add_argument('--repeat', type=int, default=5, help='runs per module, the best is taken (default: 5)')
+    args = parser.parse_args(argv)
+
+    for module in args.modules:
+        seconds, loaded = best(f'import {module}', args.repeat)
+        print(f'{module:12} {seconds*1e3:8.1f}ms  heavy: {", ".join(loaded) or "-"}', flush=True)
+
+    # first use pays the deferred imports
+    for statement in ('import nsd, numpy; nsd.get(numpy.zeros(64), 1)', 'import nsd; nsd.fit_guess(([1., 2., 3.], [1., 1., 1.]))',
+                      'import nsd_helper; nsd_helper.eng(1e-9)'):
+        seconds, loaded = best(statement, args.repeat)
+        print(f'{statement:55} {seconds*1e3:8.1f}ms  heavy: {", ".join(loaded) or "-"}', flush=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
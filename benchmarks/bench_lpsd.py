@@ -0,0 +1,33 @@
+# benchmark: 64 log spaced NSD points, nsd.get_lpsd vs nsd.smooth(nsd.get())
+# run from the repository root: python benchmarks/bench_lpsd.py
+
+import sys
+import os
+import timeit
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import nsd
+
+def peak(function):
+    '''peak traced memory in MiB of one call'''
+    tracemalloc.start()
+    function()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak_bytes / 2**20
+
+rng = np.random.default_rng(0)
+for exponent in (20, 22, 24):
+    ts_values = rng.standard_normal(2**exponent)
+    white = (2 / 50)**0.5 * ts_values.std()
+    cases = (
+        ('smooth(get())', lambda: nsd.smooth(nsd.get(ts_values, 50), 64)),
+        ('get_lpsd', lambda: nsd.get_lpsd(ts_values, 50, 64)),
+        ('get_lpsd all', lambda: nsd.get_lpsd(ts_values, 50, 64, max_averages=None)),
+    )
+    for name, function in cases:
+        seconds = min(timeit.repeat(function, number=1, repeat=3))
+        scatter = np.std(np.log(function()[1] / white))
+        print(f'2**{exponent:<2} {name:14} {seconds:7.3f}s  peak: {peak(function):7.1f}MiB  scatter: {scatter:.3f}')
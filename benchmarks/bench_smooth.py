@@ -0,0 +1,36 @@
+# benchmark: nsd.smooth, Python loop (before) vs vectorized searchsorted/reduceat
+# run from the repository root: python benchmarks/bench_smooth.py
+
+import sys
+import os
+import timeit
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import nsd
+
+def smooth_loop(ordered_nsd, nsd_bins=64, filter_function=np.mean):
+    '''nsd.smooth as it was before, walking the frequencies in a while loop'''
+    geomspace = np.geomspace(ordered_nsd[0][0],ordered_nsd[0][-1],num=nsd_bins)
+    frequencies = []
+    nsd = []
+    i1 = int(0)
+    i2 = int(1)
+    for freq in geomspace[1:]:
+        while ordered_nsd[0][i2] < freq:
+            i2 +=1
+        freq_mean = ordered_nsd[0][i1:i2+1].mean()
+        values_filtered = filter_function(ordered_nsd[1][i1:i2+1])
+        frequencies.append(freq_mean)
+        nsd.append(values_filtered)
+        i1 = i2
+    return (frequencies, nsd)
+
+rng = np.random.default_rng(0)
+for exponent in (12, 16, 20):
+    bins = 2**exponent
+    ordered_nsd = (np.arange(1, bins + 1) * 0.01, rng.exponential(size=bins)**0.5)
+    for name, filter_function in (('mean', np.mean), ('median', np.median)):
+        loop = min(timeit.repeat(lambda: smooth_loop(ordered_nsd, 64, filter_function), number=1, repeat=3))
+        vectorized = min(timeit.repeat(lambda: nsd.smooth(ordered_nsd, 64, filter_function), number=1, repeat=3))
+        print(f'2**{exponent:<2} {name:6} loop: {loop*1e3:9.3f}ms  vectorized: {vectorized*1e3:8.3f}ms ({loop/vectorized:5.1f}x)')
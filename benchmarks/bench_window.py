@@ -0,0 +1,36 @@
+# micro-benchmark: window generation, loop (before) vs vectorized vs cached
+# run from the repository root: python benchmarks/bench_window.py
+
+import sys
+import os
+import timeit
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import nsd
+
+def window_HFT90D_loop(length):
+    '''window_HFT90D as it was built before, one sample per interpreter iteration'''
+    noverlap = int(length * 0.76)
+    window = np.empty(length)
+    for i in range(length):
+        z = (2.0 * np.pi * i) / length
+        window[i] = (
+            1
+            - (1.942604 * np.cos(z))
+            + (1.340318 * np.cos(2 * z))
+            - (0.440811 * np.cos(3 * z))
+            + (0.043097 * np.cos(4 * z))
+        )
+    return noverlap, window
+
+for exponent in (10, 14, 18, 20):
+    length = 2**exponent
+    number = max(1, 2**20 // length)
+    loop = min(timeit.repeat(lambda: window_HFT90D_loop(length), number=1, repeat=3))
+    vectorized = min(timeit.repeat(lambda: nsd.window_HFT90D(length), number=number, repeat=3)) / number
+    nsd.cached_window(nsd.window_HFT90D, length)
+    cached_number = 1000 if length <= nsd.cached_window_length else number  # longer windows are not cached
+    cached = min(timeit.repeat(lambda: nsd.cached_window(nsd.window_HFT90D, length), number=cached_number, repeat=3)) / cached_number
+    assert np.allclose(window_HFT90D_loop(length)[1], nsd.window_HFT90D(length)[1])
+    print(f'2**{exponent:<2} loop: {loop*1e3:9.3f}ms  vectorized: {vectorized*1e3:8.3f}ms ({loop/vectorized:6.0f}x)  cached: {cached*1e6:6.2f}us')
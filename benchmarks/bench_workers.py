@@ -0,0 +1,23 @@
+# scaling benchmark: nsd.get with 1, 2, 4 & 8 workers vs the serial signal.welch
+# run from the repository root: python benchmarks/bench_workers.py [exponent of samples, default 24]
+
+import sys
+import os
+import timeit
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import nsd
+
+exponent = int(sys.argv[1]) if len(sys.argv) > 1 else 24
+ts_values = np.random.default_rng(0).standard_normal(2**exponent)
+nsd_bins = 2**16
+
+print(f'{os.cpu_count()} cores, 2**{exponent} samples, nsd_bins 2**16')
+serial = min(timeit.repeat(lambda: nsd.get(ts_values, 50, nsd_bins), number=1, repeat=3))
+reference = nsd.get(ts_values, 50, nsd_bins)[1]
+print(f'serial welch: {serial:7.3f}s')
+for workers in (1, 2, 4, 8):
+    parallel = min(timeit.repeat(lambda: nsd.get(ts_values, 50, nsd_bins, workers=workers), number=1, repeat=3))
+    deviation = np.max(np.abs(nsd.get(ts_values, 50, nsd_bins, workers=workers)[1] / reference - 1))
+    print(f'workers {workers}: {parallel:7.3f}s ({serial/parallel:4.2f}x)  max relative deviation: {deviation:.1e}')
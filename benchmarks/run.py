@@ -0,0 +1,125 @@
+# benchmark suite: wall time & peak memory of the hot paths, with history to catch regressions
+# run from the repository root: python benchmarks/run.py [--max-exponent 26] [--filter get/] [--fail-on-regression]
+#
+# Each run appends one JSON line to the history file (default: benchmarks/history.jsonl, not versioned)
+# and is compared to the previous run: cases slower than --threshold are reported as regressions.
+
+import sys
+import os
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tracemalloc
+import numpy as np
+import scipy
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import nsd
+import nsd_helper
+
+sample_rate = 50
+
+def noise(samples):
+    '''white & brownian noise, corner 0.1Hz/1nV'''
+    return nsd_helper.nsd_noise(samples, noise_types=['white', 'brownian'], sps=sample_rate)
+
+def cases(max_exponent):
+    '''yields (name, function) of all benchmark cases, the data is prepared outside of the function'''
+    windows = {'HFT90D': nsd.window_HFT90D, 'flattop': nsd.window_flattop}
+    for exponent in range(16, max_exponent + 1, 2):
+        ts_values = noise(2**exponent)
+        for window_name, window_function in windows.items():
+            yield (f'get/{window_name}/2**{exponent}/nsd_bins=len/4',
+                   lambda: nsd.get(ts_values, sample_rate, window_function=window_function))
+        yield (f'get/HFT90D/2**{exponent}/nsd_bins=2**12', lambda: nsd.get(ts_values, sample_rate, 2**12))
+        del ts_values
+
+    rng = np.random.default_rng(0)
+    for exponent in range(14, min(max_exponent, 24) + 1, 2):
+        nsd_values = (np.arange(1, 2**exponent + 1) * 1e-3, rng.exponential(size=2**exponent)**0.5 * 1e-9)
+        yield (f'smooth/mean/2**{exponent}', lambda: nsd.smooth(nsd_values, 64))
+        yield (f'smooth/median/2**{exponent}', lambda: nsd.smooth(nsd_values, 64, np.median))
+
+    nsd_values = nsd.get(noise(2**18), sample_rate)
+    yield ('fit/2**15', lambda: nsd.fit(nsd_values))
+    yield ('fit_loglog/2**15', lambda: nsd.fit_loglog(nsd_values))
+
+    for exponent in range(16, min(max_exponent, 24) + 1, 2):
+        yield (f'nsd_noise/2**{exponent}', lambda: noise(2**exponent))
+    for exponent in range(16, min(max_exponent, 24) + 1, 2):
+        yield (f'tone/2**{exponent}', lambda: nsd_helper.tone(1e-9, 1, sample_rate, 2**exponent))
+
+def measure(function, repeat):
+    '''best wall time of repeat runs & peak traced memory (tracemalloc, separate run) in bytes'''
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(seconds), peak
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+def last_results(history):
+    if not os.path.exists(history):
+        return {}
+    with open(history) as file:
+        lines = [line for line in file if line.strip()]
+    return json.loads(lines[-1])['results'] if lines else {}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmark the NSD hot paths')
+    parser.add_argument('--max-exponent', type=int, default=22, help='largest series 2**n samples, up to 26 (default: 22)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case, the best is taken (default: 3)')
+    parser.add_argument('--filter', default='', help='only cases containing this text, e.g. get/ or smooth')
+    parser.add_argument('--history', default=os.path.join(os.path.dirname(__file__), 'history.jsonl'))
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slow down reported as regression (default: 0.2)')
+    parser.add_argument('--fail-on-regression', action='store_true', help='exit code 1 on regressions')
+    args = parser.parse_args(argv)
+
+    previous = last_results(args.history)
+    results = {}
+    regressions = []
+    for name, function in cases(args.max_exponent):
+        if args.filter not in name:
+            continue
+        seconds, peak = measure(function, args.repeat)
+        results[name] = {'seconds': seconds, 'peak_bytes': peak}
+        line = f'{name:45} {seconds*1e3:10.2f}ms {peak/2**20:9.1f}MiB'
+        if name in previous:
+            change = seconds / previous[name]['seconds'] - 1
+            line += f' {change:+7.1%}'
+            if change > args.threshold:
+                line += ' REGRESSION'
+                regressions.append(name)
+        print(line, flush=True)
+
+    with open(args.history, 'a') as file:
+        file.write(json.dumps({
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'scipy': scipy.__version__,
+            'results': results,
+        }) + '\n')
+
+    if regressions:
+        print(f'{len(regressions)} regression(s) > {args.threshold:.0%}: {", ".join(regressions)}')
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
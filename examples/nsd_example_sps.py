@@ -3,6 +3,7 @@ import colorednoise as cn
 import matplotlib.pyplot as plt
 from matplotlib.ticker import EngFormatter
 import nsd
+import nsd_helper as nh
 
 samples = 2**22 # number of samples to generate 2**20 = 1Mio - chart was generated with 2**26
 sample_rate = 50 # in Hz
@@ -20,13 +21,6 @@ def get_noise(samples):
     brownian_white = white + brownian
     return brownian_white
 
-def tones(rms, freq, fs, samples):
-    ur = []
-    for i in range (0, samples):
-        t = i / fs
-        ur.append(rms * 2**0.5 * np.cos(2 * np.pi * freq * t))
-    return np.array(ur)
-
 def plotnsd(values_list, title):
     # Plot
     fig, ax = plt.subplots(figsize=(15, 10))
@@ -53,7 +47,7 @@ def plotnsd(values_list, title):
 
 ts_noise = get_noise(samples)
 
-ts_noise += tones(6e-11, 1, sample_rate, samples) + tones(6e-11, 0.01, sample_rate, samples) 
+ts_noise += nh.tone([6e-11, 6e-11], [1, 0.01], sample_rate, samples)
 
 nsd_noise = nsd.get(ts_noise, sample_rate, nsd_bins)
 
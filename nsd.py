@@ -4,9 +4,13 @@
 
 """Generates an estimation of the noise amplitude spectral density (NSD) of a time series"""
 
+import concurrent.futures
+import functools
 import numpy as np
-from scipy import signal, integrate
-from scipy.optimize import curve_fit
+from scipy import fft
+import nsd_profile
+
+# scipy.signal, .integrate, .optimize & .stats are imported where they are used, so `import nsd` stays cheap
 
 
 def series_rms(values: tuple) -> float:
@@ -32,16 +36,18 @@ def nsd_rms(nsd: tuple) -> float:
     Parameters:
     -----------
     nsd : [array_like, array_like]
-        nsd[0]: frequencies, nsd[1]: NSD values
+        nsd[0]: frequencies, nsd[1]: NSD values, 2-D (channels x frequencies) for stacked NSDs from get_many()
 
     Returns
     -------
-    out : float
+    out : float or array
+        one RMS per channel for stacked NSDs
     """
-    return integrate.trapezoid(y=nsd[1], x=nsd[0]**0.5)
+    from scipy import integrate
+    return integrate.trapezoid(y=nsd[1], x=np.asarray(nsd[0])**0.5, axis=-1)
 
 
-def window_flattop(length: int):
+def window_flattop(length: int, dtype=np.float64):
     """Window flattop
 
     coeffs = [0.21557895, 0.41663158, 0.277263158, 0.083578947, 0.006947368]
@@ -51,16 +57,20 @@ def window_flattop(length: int):
     length : int
         number of samples to generate
 
+    dtype : data-type, optional
+        default: np.float64
+
     Returns
     -------
     out : [int, array]
         number of overlapping samples of the window (index 0) and array of the window values (index 1)
     """
+    from scipy import signal
     noverlap = int(length * 0.76)  # 0.76 is a guess
-    return noverlap, signal.get_window("flattop", length, fftbins=False)
+    return noverlap, signal.get_window("flattop", length, fftbins=False).astype(dtype, copy=False)
 
 
-def window_HFT90D(length: int):
+def window_HFT90D(length: int, dtype=np.float64):
     """Window HFT90D - from https://holometer.fnal.gov/GH_FFT.pdf
 
     wj = 1 − 1.942604 cos(z) + 1.340318 cos(2z) − 0.440811 cos(3z) + 0.043097 cos(4z)
@@ -70,63 +80,180 @@ def window_HFT90D(length: int):
     length : int
         number of samples to generate
 
+    dtype : data-type, optional
+        computed in float64, returned as dtype
+        default: np.float64
+
     Returns
     -------
     out : [ínt, array]
         number of overlapping samples of the window (index 0) and array of the window values (index 1)
     """
     noverlap = int(length * 0.76)
-    window = np.empty(length)
-    for i in range(length):
-        z = (2.0 * np.pi * i) / length
-        window[i] = (
-            1
-            - (1.942604 * np.cos(z))
-            + (1.340318 * np.cos(2 * z))
-            - (0.440811 * np.cos(3 * z))
-            + (0.043097 * np.cos(4 * z))
-        )
+    cos_z = phasor(2.0 * np.pi / length, length).real
+    # cos(n z) by the recurrence cos(n z) = 2 cos(z) cos((n-1) z) - cos((n-2) z), no np.cos over the whole length
+    cos_2z = 2 * cos_z * cos_z - 1
+    cos_3z = 2 * cos_z * cos_2z - cos_z
+    cos_4z = 2 * cos_z * cos_3z - cos_2z
+    window = (
+        1
+        - (1.942604 * cos_z)
+        + (1.340318 * cos_2z)
+        - (0.440811 * cos_3z)
+        + (0.043097 * cos_4z)
+    )
+
+    return noverlap, window.astype(dtype, copy=False)
+
+# windows up to this length are cached: at most 32 * 2 MiB of float64 windows stay in memory
+cached_window_length = 2**18
+
+def cached_window(window_function, length: int, dtype=np.float64):
+    """Window of window_function, cached (LRU) by window function, length & dtype
+
+    Repeated calls, e.g. get() with the same nsd_bins, reuse the window instead of rebuilding it.
+    Windows longer than cached_window_length are built on every call, their FFTs cost far more than the window
+    and the cache would keep them in memory.
+
+    Parameters:
+    -----------
+    window_function : function(length: int)
+        e.g. window_HFT90D, see get()
+
+    length : int
+        number of samples to generate
 
+    dtype : data-type, optional
+        default: np.float64
+
+    Returns
+    -------
+    out : [int, array]
+        number of overlapping samples of the window (index 0) and read-only array of the window values (index 1)
+    """
+    if length > cached_window_length:
+        return _window(window_function, length, dtype)
+    return _cached_window(window_function, length, dtype)
+
+def _window(window_function, length, dtype):
+    noverlap, window = window_function(length)
+    window = np.array(window, dtype=dtype)
+    window.flags.writeable = False
     return noverlap, window
 
-# TODO overlapping
-def smooth(ordered_nsd, nsd_bins=64, filter_function=np.mean):
+_cached_window = functools.lru_cache(maxsize=32)(_window)
+
+def bin_sums(values, start, stop):
+    """Sums of values[..., start[i]:stop[i]] for all bins i, vectorized with reduceat
+
+    Parameters:
+    -----------
+    values : array_like
+        values to be summed along the last axis
+
+    start, stop : array_like of int
+        first & behind last index of each bin, start < stop, bins may overlap
+
+    Returns
+    -------
+    out : array
+        sum of each bin, shape (..., len(start))
+    """
+    values = np.asarray(values)
+    padded = np.concatenate((values, np.zeros(values.shape[:-1] + (1,))), axis=-1)
+    indices = np.column_stack((start, stop)).ravel()
+    return np.add.reduceat(padded, indices, axis=-1)[..., ::2]
+
+def bin_percentiles(values, start, stop, q):
+    """Percentile q of values[..., start[i]:stop[i]] for all bins i
+
+    One np.percentile (partition, O(n)) per bin along the last axis, so all channels of stacked values are
+    done at once and the cost is linear in the number of values.
+
+    Parameters:
+    -----------
+    values : array_like
+        values along the last axis
+
+    start, stop : array_like of int
+        first & behind last index of each bin, start < stop, bins may overlap
+
+    q : float
+        percentile, 50 for the median
+
+    Returns
+    -------
+    out : array
+        percentile of each bin, shape (..., len(start))
+    """
+    values = np.asarray(values)
+    out = np.empty(values.shape[:-1] + (len(start),))
+    for i, (i1, i2) in enumerate(zip(start, stop)):
+        out[..., i] = np.percentile(values[..., i1:i2], q, axis=-1)
+    return out
+
+@nsd_profile.staged('smooth')
+def smooth(ordered_nsd, nsd_bins=64, filter_function=np.mean, overlap=0.0, percentile=None):
     """Smooth the NSD evenly spaced in log space
 
+    Bins are cut at nsd_bins log spaced edges between the first and last frequency, the frequency of a bin is
+    the mean of its frequencies. Empty bins (no frequency between two edges, e.g. at the low end of a short NSD)
+    are dropped, so fewer than nsd_bins - 1 points may be returned.
+
     Parameters:
     -----------
 
     ordered_nsd : [array_like, array_like]
-        ordered_nsd[0]: ascending ordered frequencies, ordered_nsd[1]: corresponding NSD values
+        ordered_nsd[0]: ascending ordered frequencies, ordered_nsd[1]: corresponding NSD values,
+        2-D (channels x frequencies) for stacked NSDs from get_many()
 
     nsd_bins : int, optional
-        number of NSD bins (points) to be calculated
+        number of log spaced bin edges
         default: 64
 
     filter_function : function(array_like), optional
         returns: [array_like]
             filtered values
+        np.mean, np.median (and the nan variants) are computed vectorized, any other function is called per bin
         default: np.mean
 
+    overlap : float, optional
+        each bin is widened into its neighbours by this fraction of the (log) bin width on both sides,
+        e.g. 0.5: consecutive bins share half a bin width
+        default: 0.0, no overlapping
+
+    percentile : float, optional
+        percentile (0-100) of each bin instead of filter_function, computed vectorized
+        default: None
+
     Returns
     -------
     out : [array, array]
         The frequencies (index 0) and the corresponding smoothed NSD values (index 1)
     """
-    geomspace = np.geomspace(ordered_nsd[0][0],ordered_nsd[0][-1],num=nsd_bins)
-    frequencies = []
-    nsd = []
-    i1 = int(0)
-    i2 = int(1)
-    for freq in geomspace[1:]:
-        while ordered_nsd[0][i2] < freq:
-            i2 +=1
-        freq_mean = ordered_nsd[0][i1:i2+1].mean()
-        values_filtered = filter_function(ordered_nsd[1][i1:i2+1])
-        frequencies.append(freq_mean)
-        nsd.append(values_filtered)
-        i1 = i2
-    return (frequencies, nsd)
+    frequencies = np.asarray(ordered_nsd[0])
+    values = np.asarray(ordered_nsd[1])
+    edges = np.geomspace(frequencies[0], frequencies[-1], num=nsd_bins)
+    widening = (edges[1] / edges[0])**overlap
+    lower = edges[:-1] / widening
+    upper = edges[1:] * widening
+    start = np.searchsorted(frequencies, lower)
+    stop = np.searchsorted(frequencies, upper)
+    stop[upper >= frequencies[-1]] = len(frequencies)
+    start, stop = start[stop > start], stop[stop > start]
+
+    if percentile is None and filter_function in (np.median, np.nanmedian):
+        percentile = 50
+    if percentile is not None:
+        nsd = bin_percentiles(values, start, stop, percentile)
+    elif filter_function in (np.mean, np.nanmean):
+        nsd = bin_sums(values, start, stop) / (stop - start)
+    else:
+        nsd = np.array([[filter_function(row[i1:i2]) for i1, i2 in zip(start, stop)]
+                        for row in values.reshape(-1, values.shape[-1])])
+        nsd = nsd.reshape(values.shape[:-1] + (len(start),))
+    nsd_profile.count('smoothed bins', len(start))
+    return (bin_sums(frequencies, start, stop) / (stop - start), nsd)
 
 def fit_function(freq, slope, freq_exp, white):
     '''NSD fit function for 1/f^n + white noise
@@ -142,7 +269,23 @@ def fit_function_loglog(freq, slope, freq_exp, white):
     '''
     return np.log10((10**slope / ((10**freq) ** ((10**freq_exp) / 2))) + 10**white)
 
-def fit(nsd, fit_function=fit_function):
+def fit_jacobian(freq, slope, freq_exp, white):
+    '''Analytic Jacobian of fit_function, shape (len(freq), 3)
+    '''
+    power = freq**(-freq_exp/2)
+    return np.column_stack((power, -slope * power * np.log(freq) / 2, np.ones_like(power)))
+
+def fit_jacobian_loglog(freq, slope, freq_exp, white):
+    '''Analytic Jacobian of fit_function_loglog, shape (len(freq), 3)
+    '''
+    colored = 10**slope / ((10**freq) ** ((10**freq_exp) / 2))
+    total = colored + 10**white
+    return np.column_stack((colored / total,
+                            -colored * freq * 10**freq_exp * np.log(10) / 2 / total,
+                            10**white / total))
+
+@nsd_profile.staged('curve_fit')
+def fit(nsd, fit_function=fit_function, p0=None, jac=None):
     """Least squares curve fitting the NSD
 
        Gives worse fits than fitting in loglog space, see fit_loglog
@@ -157,14 +300,24 @@ def fit(nsd, fit_function=fit_function):
         The function in loglog space to fit the nsd
         default: fit_function_loglog = np.log10((10**slope / ((10**freq) ** ((10**freq_exp) / 2)) + 10**white))
 
+    p0 : [float, float, float], optional
+        initial guess of the parameters, see fit_guess
+        default: None, all 1
+
+    jac : function, optional
+        Jacobian of fit_function, e.g. fit_jacobian
+        default: None, numerical
+
     Returns
     -------
     out : [array, array]
         The optimal values for the parameters (index 0) and the corresponding estimated covariance (index 1)
     """
-    return curve_fit(fit_function, nsd[0], nsd[1])
+    from scipy.optimize import curve_fit
+    return curve_fit(fit_function, nsd[0], nsd[1], p0=p0, jac=jac)
 
-def fit_loglog(nsd, fit_function=fit_function_loglog):
+@nsd_profile.staged('curve_fit')
+def fit_loglog(nsd, fit_function=fit_function_loglog, p0=None, jac=None):
     """Least squares curve fitting the NSD in loglog space
 
        Gives better fits than fitting in linear space, see fit
@@ -179,20 +332,518 @@ def fit_loglog(nsd, fit_function=fit_function_loglog):
         The function in loglog space to fit the nsd
         default: fit_function_loglog = np.log10((10**slope / ((10**freq) ** ((10**freq_exp) / 2)) + 10**white))
 
+    p0 : [float, float, float], optional
+        initial guess of the parameters in linear space, see fit_guess
+        default: None, all 1 in loglog space
+
+    jac : function, optional
+        Jacobian of fit_function in loglog space, e.g. fit_jacobian_loglog
+        default: None, numerical
+
     Returns
     -------
     out : [array, array]
         The optimal values for the parameters (index 0) and the corresponding estimated covariance (index 1)
     """
-    popt, pcov = curve_fit(fit_function, np.log10(nsd[0]), np.log10(nsd[1]))
+    if p0 is not None:
+        p0 = np.log10(p0)
+    from scipy.optimize import curve_fit
+    popt, pcov = curve_fit(fit_function, np.log10(nsd[0]), np.log10(nsd[1]), p0=p0, jac=jac)
     return (10**popt, pcov)
 
+def fit_guess(nsd):
+    """Initial guess of the fit parameters from the data
+
+    white: median of the upper 10% of the frequencies, slope & freq_exp: line in loglog space through the first decade
+
+    Parameters:
+    -----------
+
+    nsd : [array, array]
+        NSD from get()
+
+    Returns
+    -------
+    out : array
+        slope, freq_exp, white
+    """
+    frequencies, values = np.asarray(nsd[0]), np.asarray(nsd[1])
+    if frequencies.ndim != 1 or values.shape != frequencies.shape or len(frequencies) < 3:
+        raise ValueError(f'need one NSD of at least 3 points, got shapes {frequencies.shape} & {values.shape}')
+    white = np.median(values[-max(1, len(values) // 10):])
+    low = max(2, np.count_nonzero(frequencies <= frequencies[0] * 10))
+    gradient, intercept = np.polyfit(np.log10(frequencies[:low]), np.log10(values[:low]), 1)
+    return np.array([10**intercept, np.clip(-2 * gradient, 0.1, 4), white])
+
+fit_dtype = np.dtype([
+    ('slope', 'f8'),
+    ('freq_exp', 'f8'),
+    ('white', 'f8'),
+    ('covariance', 'f8', (3, 3)),
+    ('corner', 'f8'),
+])
+
+def fit_corner(nsd, loglog: bool=True):
+    """Fit one NSD with guessed initial values & analytic Jacobian, see fit_many
+
+    Returns
+    -------
+    out : tuple
+        slope, freq_exp, white, covariance, 1/f corner frequency (NaN if the fit failed)
+    """
+    try:
+        if loglog:
+            popt, pcov = fit_loglog(nsd, p0=fit_guess(nsd), jac=fit_jacobian_loglog)
+        else:
+            popt, pcov = fit(nsd, p0=fit_guess(nsd), jac=fit_jacobian)
+    except (RuntimeError, ValueError):
+        return (np.nan, np.nan, np.nan, np.full((3, 3), np.nan), np.nan)
+    slope, freq_exp, white = popt
+    with np.errstate(all='ignore'):
+        corner = (slope / white)**(2 / freq_exp)
+    return (slope, freq_exp, white, pcov, corner)
+
+def fit_many(nsds, loglog: bool=True, workers: int=None):
+    """Least squares curve fitting of many NSDs
+
+    Initial guesses from the data (fit_guess), analytic Jacobians (fit_jacobian, fit_jacobian_loglog),
+    optionally in a process pool (the calling script needs an if __name__ == '__main__': guard on Windows).
+
+    Parameters:
+    -----------
+
+    nsds : [array, array] or list of [array, array]
+        stacked NSDs from get_many() (frequencies, channels x frequencies) or a list of NSDs from get()
+
+    loglog : bool, optional
+        fit in loglog space (fit_loglog) instead of linear space (fit)
+        default: True
+
+    workers : int, optional
+        number of processes
+        default: None, serial
+
+    Returns
+    -------
+    out : structured array
+        one record per NSD with the fields slope, freq_exp, white (linear values), covariance (3x3, in the fit space)
+        and corner: the 1/f corner frequency, where slope / f^(freq_exp/2) equals white. Failed fits are NaN.
+    """
+    if len(nsds) == 2 and np.ndim(nsds[0]) == 1 and np.ndim(nsds[1]) == 2:
+        nsds = [(nsds[0], values) for values in nsds[1]]
+    if workers is None or workers <= 1:
+        results = [fit_corner(nsd, loglog) for nsd in nsds]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(fit_corner, nsds, [loglog] * len(nsds), chunksize=max(1, len(nsds) // (4 * workers))))
+    return np.array(results, dtype=fit_dtype)
+
+def segments(ts_values: tuple, nsd_bins: int, noverlap: int):
+    """Overlapping segments of a time series as a strided view (no copy)
+
+    Same segmentation as signal.welch: trailing samples, which do not fill a whole segment, are ignored
+
+    Parameters:
+    -----------
+    ts_values : array_like
+        Time series of the signal (amplitude), time along the last axis
+
+    nsd_bins : int
+        number of samples per segment
+
+    noverlap : int
+        number of overlapping samples of consecutive segments
+
+    Returns
+    -------
+    out : array
+        read-only view of shape (..., number of segments, nsd_bins)
+    """
+    step = nsd_bins - noverlap
+    return np.lib.stride_tricks.sliding_window_view(ts_values, nsd_bins, axis=-1)[..., ::step, :]
+
+def periodograms(ts_segments, window, sample_frequency: float):
+    """One-sided PSD of each segment, detrended (mean removed) & scaled like signal.welch
+
+    Parameters:
+    -----------
+    ts_segments : array_like
+        segments of the time series, shape (..., nsd_bins), see segments()
+
+    window : array_like
+        values of the window function, length nsd_bins
+
+    sample_frequency : int/float
+        The sample frequency in Hz (SPS - Samples per second)
+
+    Returns
+    -------
+    out : array
+        PSD of each segment, shape (..., nsd_bins//2 + 1)
+    """
+    spectrum = spectra(ts_segments, window)
+    psd = spectrum.real**2 + spectrum.imag**2
+    return one_sided(psd, window, sample_frequency)
+
+def spectra(ts_segments, window):
+    """Spectrum (rfft) of each segment, detrended (mean removed) & windowed, shape (..., nsd_bins//2 + 1)"""
+    if nsd_profile.active():  # every FFT of segments passes here: get, get_csd, get_timeresolved, nsd_stream, ...
+        count = int(np.prod(np.shape(ts_segments)[:-1]))
+        nsd_profile.count('segments', count)
+        nsd_profile.fft_size(len(window), count)
+    values = ts_segments - ts_segments.mean(axis=-1, keepdims=True)
+    values *= window
+    return fft.rfft(values, axis=-1)
+
+def one_sided(power, window, sample_frequency: float):
+    """Scale the squared magnitudes (or cross products) of spectra() in place to a one-sided density like signal.welch"""
+    power *= 1.0 / (sample_frequency * (window * window).sum())
+    # one-sided: double all but DC (and Nyquist for even lengths)
+    if len(window) % 2:
+        power[..., 1:] *= 2
+    else:
+        power[..., 1:-1] *= 2
+    return power
+
+def periodogram_sum(
+    ts_values: tuple,
+    sample_frequency: float,
+    window,
+    noverlap: int,
+    block_size: int=2**22,
+    workers: int=None,
+):
+    """Sum of the one-sided PSDs of all segments of a time series
+
+    The segments are processed in blocks of about block_size samples, so memory stays bounded
+    independent of the length of ts_values. With workers the blocks are transformed & summed in a thread pool,
+    numpy & scipy.fft release the GIL, the result matches the serial sum within rounding.
+
+    Parameters:
+    -----------
+    ts_values : array_like
+        Time series of the signal (amplitude), time along the last axis
+
+    sample_frequency : int/float
+        The sample frequency in Hz (SPS - Samples per second)
+
+    window : array_like
+        values of the window function, its length is the segment length
+
+    noverlap : int
+        number of overlapping samples of consecutive segments
+
+    block_size : int, optional
+        number of segment samples to be transformed at once
+        default: 2**22
+
+    workers : int, optional
+        number of threads
+        default: None, serial
+
+    Returns
+    -------
+    out : [array, int]
+        The summed PSD (index 0) and the number of segments (index 1)
+    """
+    ts_segments = segments(ts_values, len(window), noverlap)
+    count = ts_segments.shape[-2]
+    block = max(1, block_size // len(window))
+    if workers is not None and workers > 1:
+        block = max(1, min(block, -(-count // workers)))
+
+    def block_sum(start):
+        return periodograms(ts_segments[..., start:start + block, :], window, sample_frequency).sum(axis=-2)
+
+    starts = range(0, count, block)
+    if workers is None or workers <= 1:
+        sums = map(block_sum, starts)
+    else:
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            sums = list(executor.map(block_sum, starts))
+    psd_sum = np.zeros(ts_segments.shape[:-2] + (len(window)//2 + 1,))
+    for block_psd_sum in sums:
+        psd_sum += block_psd_sum
+    return psd_sum, count
+
+# seconds per L*log2(L) of one Welch segment of get(), used by plan() to estimate the runtime,
+# measured on a desktop CPU, calibrate() replaces it with the speed of this machine
+fft_seconds = 1.5e-9
+
+def calibrate() -> float:
+    """Measure the seconds per L*log2(L) of one Welch segment of get() on this machine and use them in plan()
+
+    Takes about 0.3 s, runs outside of active nsd_profile profiles, so they do not record the calibration.
+
+    Returns
+    -------
+    out : float
+        the new fft_seconds
+    """
+    global fft_seconds
+    import time
+    length = 2**12
+    ts_values = np.random.default_rng(0).standard_normal(2**17)
+    segments = (len(ts_values) - int(length * 0.76)) // (length - int(length * 0.76))
+    seconds = []
+    with nsd_profile.paused():
+        for _ in range(3):
+            start = time.perf_counter()
+            get(ts_values, 1.0, length)
+            seconds.append(time.perf_counter() - start)
+    fft_seconds = min(seconds) / (segments * length * np.log2(length))
+    return fft_seconds
+
+def plan(
+    samples: int,
+    sample_frequency: float,
+    nsd_bins: int=None,
+    window_function=window_HFT90D,
+    mode: str='trim',
+):
+    """Plan a Welch estimate: fast FFT length near nsd_bins & series length without leftover samples
+
+    FFT lengths with large prime factors are several times slower (e.g. the default nsd_bins = samples/4 of an
+    odd sample count), the planned nsd_bins is the nearest 2, 3, 5 & 7-smooth length (scipy.fft.next_fast_len &
+    prev_fast_len). The overlap stays the one of window_function. The report is computed before any FFT,
+    the runtime is estimated from fft_seconds, a typical desktop speed unless calibrate() measured this machine.
+
+    Parameters:
+    -----------
+
+    samples : int
+        number of samples of the time series
+
+    sample_frequency : int/float
+        The sample frequency in Hz (SPS - Samples per second)
+
+    nsd_bins : int, optional
+        requested number of NSD bins (samples per segment)
+        default: 1/4 samples
+
+    window_function : function(length: int), optional
+        default: window_HFT90D
+
+    mode : str, optional
+        'trim': drop the samples, which do not fill a whole segment (as signal.welch does)
+        'pad': append zeros to fill the last segment, its power is slightly underestimated
+        default: 'trim'
+
+    Returns
+    -------
+    out : dict
+        nsd_bins, noverlap, segments, samples (after trim/pad), padding (zeros appended), trimmed (samples dropped),
+        resolution (Hz), equivalent_averages (see equivalent_averages()), seconds (estimated runtime of get())
+    """
+    if mode not in ('trim', 'pad'):
+        raise ValueError(f'unsupported mode: {mode}')
+    if nsd_bins is None:
+        nsd_bins = int(samples/4)
+    candidates = [fft.prev_fast_len(nsd_bins, real=True), fft.next_fast_len(nsd_bins, real=True)]
+    candidates = [length for length in candidates if length <= samples] or candidates[:1]
+    length = min(candidates, key=lambda length: abs(length - nsd_bins))
+    noverlap, window = cached_window(window_function, length)
+    step = length - noverlap
+    if mode == 'trim':
+        segments = max(0, (samples - noverlap) // step)
+    else:
+        segments = max(1, -(-(samples - noverlap) // step))
+    used = noverlap + segments * step if segments else 0
+    return {
+        'nsd_bins': length,
+        'noverlap': noverlap,
+        'segments': segments,
+        'samples': used,
+        'padding': max(0, used - samples),
+        'trimmed': max(0, samples - used),
+        'resolution': sample_frequency / length,
+        'equivalent_averages': equivalent_averages(window, noverlap, segments) if segments else 0.0,
+        'seconds': segments * length * np.log2(length) * fft_seconds,
+    }
+
+def planned(ts_values: tuple, plan: dict):
+    """Time series trimmed (view) or zero-padded (copy) along the last axis to plan['samples'], see plan()
+
+    Usage: nsd.get(nsd.planned(ts_values, p), sample_frequency, p['nsd_bins'])
+    """
+    samples = np.shape(ts_values)[-1]
+    if plan['samples'] <= samples:
+        return ts_values[..., :plan['samples']]
+    ts_values = np.asarray(ts_values)
+    return np.pad(ts_values, [(0, 0)] * (ts_values.ndim - 1) + [(0, plan['samples'] - samples)])
+
+class QuantileSketch:
+    """Streaming P-squared quantile estimate (Jain & Chlamtac) of many variables at once, e.g. all PSD bins
+
+    Five markers per variable track the quantile without storing the observations, memory is constant in the
+    number of observations. The first 5 observations are kept to initialise the markers.
+
+    Parameters:
+    -----------
+    q : float
+        quantile to estimate, 0 to 1
+    """
+
+    def __init__(self, q: float):
+        self.q = q
+        self.count = 0
+        self.heights = None
+        self.positions = None
+        self.desired = np.array([0, 2 * q, 4 * q, 2 + 2 * q, 4])
+        self.increments = np.array([0, q / 2, q, (1 + q) / 2, 1])
+        self.first = []
+
+    def update(self, values):
+        """Add one observation of all variables (array of the same shape every call)"""
+        self.count += 1
+        if self.heights is None:
+            self.first.append(np.array(values, dtype=np.float64))
+            if self.count == 5:
+                self.heights = np.sort(self.first, axis=0)
+                self.positions = np.broadcast_to(np.arange(5.0).reshape((5,) + (1,) * self.heights[0].ndim),
+                                                 self.heights.shape).copy()
+                self.first = None
+            return
+        heights, positions = self.heights, self.positions
+        np.minimum(heights[0], values, out=heights[0])
+        np.maximum(heights[4], values, out=heights[4])
+        cell = (values >= heights[1]).astype(np.int8) + (values >= heights[2]) + (values >= heights[3])
+        positions[1:] += np.arange(1, 5).reshape((4,) + (1,) * cell.ndim) > cell
+        self.desired += self.increments
+        for i in (1, 2, 3):
+            delta = self.desired[i] - positions[i]
+            right, left = positions[i + 1] - positions[i], positions[i - 1] - positions[i]
+            move = ((delta >= 1) & (right > 1)) | ((delta <= -1) & (left < -1))
+            if not move.any():
+                continue
+            step = np.where(delta >= 0, 1.0, -1.0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                parabolic = heights[i] + step / (right - left) * (
+                    (step - left) * (heights[i + 1] - heights[i]) / right
+                    + (right - step) * (heights[i] - heights[i - 1]) / -left)
+                linear = heights[i] + step * np.where(step > 0, (heights[i + 1] - heights[i]) / right,
+                                                      (heights[i - 1] - heights[i]) / left)
+            inside = (heights[i - 1] < parabolic) & (parabolic < heights[i + 1])
+            heights[i] = np.where(move, np.where(inside, parabolic, linear), heights[i])
+            positions[i] += np.where(move, step, 0)
+
+    @property
+    def quantile(self):
+        """Current estimate, exact for fewer than 6 observations"""
+        if self.heights is None:
+            return np.quantile(self.first, self.q, axis=0)
+        return self.heights[2].copy()
+
+def median_bias(count: int) -> float:
+    """Ratio of median to mean of count averaged periodograms (chi-squared, 2 degrees of freedom), like signal.welch"""
+    even = 2 * np.arange(1., (count - 1) // 2 + 1)
+    return 1 + np.sum(1. / (even + 1) - 1. / even)
+
+def trim_bias(trim: float) -> float:
+    """Ratio of trimmed mean to mean of exponential (chi-squared, 2 degrees of freedom) distributed periodograms"""
+    lower, upper = -np.log(1 - trim), -np.log(trim) if trim > 0 else np.inf
+    return ((lower + 1) * np.exp(-lower) - ((upper + 1) * np.exp(-upper) if trim > 0 else 0)) / (1 - 2 * trim)
+
+def periodogram_average(
+    ts_values: tuple,
+    sample_frequency: float,
+    window,
+    noverlap: int,
+    average='median',
+    trim: float=0.1,
+    block_size: int=2**22,
+):
+    """Robust average of the one-sided PSDs of all segments, e.g. against spikes & glitches in the time series
+
+    If the stack of per-segment periodograms fits in block_size values it is averaged exactly, else the quantiles
+    are estimated streaming with QuantileSketch, so memory stays bounded on long captures.
+
+    Parameters:
+    -----------
+    ts_values : array_like
+        Time series of the signal (amplitude), time along the last axis
+
+    sample_frequency : int/float
+        The sample frequency in Hz (SPS - Samples per second)
+
+    window : array_like
+        values of the window function, its length is the segment length
+
+    noverlap : int
+        number of overlapping samples of consecutive segments
+
+    average : str or float, optional
+        'median': median, bias corrected to the mean like signal.welch(average='median')
+        'trimmed': mean of the segments between the trim and 1 - trim quantile, bias corrected to the mean
+        float: percentile (0 to 100) of the segments, not bias corrected, e.g. 90 for an upper envelope
+        default: 'median'
+
+    trim : float, optional
+        fraction cut at each end for 'trimmed'
+        default: 0.1
+
+    block_size : int, optional
+        number of values of the periodogram stack to be kept in memory
+        default: 2**22
+
+    Returns
+    -------
+    out : array
+        averaged PSD, shape (..., len(window)//2 + 1)
+    """
+    ts_segments = segments(ts_values, len(window), noverlap)
+    count = ts_segments.shape[-2]
+    bins = len(window)//2 + 1
+    block = max(1, block_size // bins // max(1, int(np.prod(ts_segments.shape[:-2]))))
+
+    def blocks():
+        for start in range(0, count, block):
+            yield periodograms(ts_segments[..., start:start + block, :], window, sample_frequency)
+
+    if average not in ('median', 'trimmed') and isinstance(average, str):
+        raise ValueError(f'unsupported average: {average}')
+    if count <= block:
+        psds = periodograms(ts_segments, window, sample_frequency)
+        if average == 'median':
+            return np.median(psds, axis=-2) / median_bias(count)
+        if average == 'trimmed':
+            cut = int(trim * count)
+            psds.sort(axis=-2)
+            return psds[..., cut:count - cut, :].mean(axis=-2) / trim_bias(cut / count)
+        return np.percentile(psds, average, axis=-2)
+
+    quantiles = {'median': (0.5,), 'trimmed': (trim, 1 - trim)}[average] if isinstance(average, str) else (average / 100,)
+    sketches = [QuantileSketch(q) for q in quantiles]
+    for psds in blocks():
+        for index in range(psds.shape[-2]):
+            for sketch in sketches:
+                sketch.update(psds[..., index, :])
+    if average == 'median':
+        return sketches[0].quantile / median_bias(count)
+    if average != 'trimmed':
+        return sketches[0].quantile
+    lower, upper = sketches[0].quantile, sketches[1].quantile
+    psd_sum = np.zeros(lower.shape)
+    inside = np.zeros(lower.shape)
+    for psds in blocks():
+        keep = (psds >= lower[..., None, :]) & (psds <= upper[..., None, :])
+        psd_sum += np.where(keep, psds, 0).sum(axis=-2)
+        inside += keep.sum(axis=-2)
+    return psd_sum / np.maximum(inside, 1) / trim_bias(trim)
+
+@nsd_profile.staged('get')
 def get(
     ts_values: tuple,
     sample_frequency: float,
     nsd_bins: int=None,
     window_function=window_HFT90D,
     crop=np.s_[3:-1],
+    cascade: int=0,
+    decimation: int=8,
+    workers: int=None,
+    dtype=None,
+    average='mean',
+    trim: float=0.1,
 ):
     """Estimation of the noise amplitude spectral density (NSD) of a time series.
 
@@ -217,7 +868,7 @@ def get(
     nsd_bins : int, optional
         number of NSD bins (points) to be calculated
         needs to be lower than the ts_values count
-        default: 1/4 count of ts_values
+        default: 1/4 count of ts_values (of the last stage for cascade)
 
     window_function : function(length: int), optional
         returns: [int, array_like]
@@ -228,26 +879,549 @@ def get(
     crop : slice, optional
         default: the last and the first 3 NSD values are dropped as they are not reliable
 
+    cascade : int, optional
+        number of decimation stages: the series is repeatedly low-pass filtered & decimated (signal.decimate),
+        each stage gets a Welch with the same nsd_bins and the bands are stitched into one spectrum.
+        Each stage covers up to 0.8 of its Nyquist frequency (anti-aliasing filter passband), the next stage
+        below. Low frequencies are reached with small FFTs, less memory and more averages.
+        default: 0, no cascade
+
+    decimation : int, optional
+        decimation factor per cascade stage
+        default: 8
+
+    workers : int, optional
+        number of threads, the segments are split into blocks whose periodograms are computed & summed
+        in parallel (see periodogram_sum), the result matches the serial signal.welch within rounding
+        default: None, serial signal.welch, memory maps & series above 2**22 samples use the serial periodogram_sum,
+        its memory stays bounded by blocks instead of float64 copies of the whole series
+
+    dtype : data-type, optional
+        compute data-type of the series, window & FFT, e.g. np.float32 halves memory & FFT bandwidth.
+        float32 rounding adds a noise floor at about its epsilon (6e-8) times the amplitude of the series,
+        comparable to the quantization noise of 24 bit ADC data, typically the NSD deviates ~1e-5 from float64
+        default: None, float64 (or the promoted data-type of ts_values)
+
+    average : str or float, optional
+        average of the segment periodograms: 'mean' (Welch), robust against spikes & glitches: 'median' or
+        'trimmed' (bias corrected to the mean) or a percentile 0 to 100 (envelope), see periodogram_average.
+        Memory stays bounded, long captures use a streaming quantile estimate
+        default: 'mean'
+
+    trim : float, optional
+        fraction of the segments cut at each end for average='trimmed'
+        default: 0.1
+
     Returns
     -------
     out : [array, array]
         The frequencies (index 0) and the corresponding NSD values (index 1)
     """
+    with nsd_profile.stage('import'):  # scipy.signal on first use
+        from scipy import signal
     if nsd_bins is None:
-        nsd_bins = int(len(ts_values)/4)
-    noverlap, window = window_function(nsd_bins)
-    frequencies, psd = signal.welch(
-        x=ts_values,
-        fs=sample_frequency,
-        window=window,
-        # nperseg = len(window),
-        noverlap=noverlap,
-        # nfft = nperseg,
-        # detrend = False,
-        # return_onesided = True,
-        # scaling = 'density',
-        # axis = -1,
-        # average = 'mean'
-    )
-    # crop & transform PSD to NSD
-    return (frequencies[crop], psd[crop]**0.5)
+        nsd_bins = int(np.shape(ts_values)[-1]/decimation**cascade/4)
+    if dtype is not None:
+        ts_values = np.asarray(ts_values, dtype=dtype)
+    with nsd_profile.stage('window'):
+        noverlap, window = cached_window(window_function, nsd_bins, np.float64 if dtype is None else dtype)
+    bands = []
+    upper = np.inf
+    for stage in range(cascade + 1):
+        with nsd_profile.stage('welch' if average == 'mean' else f'average={average}'):
+            if average != 'mean':
+                frequencies = fft.rfftfreq(nsd_bins, 1 / sample_frequency)
+                psd = periodogram_average(ts_values, sample_frequency, window, noverlap, average, trim).astype(window.dtype)
+            elif workers is None and not isinstance(ts_values, np.memmap) and np.size(ts_values) <= 2**22:
+                frequencies, psd = signal.welch(
+                    x=ts_values,
+                    fs=sample_frequency,
+                    window=window,
+                    # nperseg = len(window),
+                    noverlap=noverlap,
+                    # nfft = nperseg,
+                    # detrend = False,
+                    # return_onesided = True,
+                    # scaling = 'density',
+                    # axis = -1,
+                    # average = 'mean'
+                )
+                if nsd_profile.active():  # the other paths record in spectra()
+                    count = (np.shape(ts_values)[-1] - noverlap) // (nsd_bins - noverlap) * int(np.prod(np.shape(ts_values)[:-1]))
+                    nsd_profile.count('segments', count)
+                    nsd_profile.fft_size(nsd_bins, count)
+            else:
+                psd_sum, count = periodogram_sum(ts_values, sample_frequency, window, noverlap, workers=workers)
+                frequencies, psd = fft.rfftfreq(nsd_bins, 1 / sample_frequency), (psd_sum / count).astype(window.dtype)
+        frequencies, psd = frequencies[crop], psd[..., crop]
+        if stage == cascade:
+            lower = 0
+        else:
+            lower = 0.8 * sample_frequency / decimation / 2  # passband edge of the next stage
+            with nsd_profile.stage('decimate'):
+                ts_values = signal.decimate(ts_values, decimation, zero_phase=True)
+            if dtype is not None:
+                ts_values = ts_values.astype(dtype, copy=False)
+            sample_frequency /= decimation
+        band = (frequencies > lower) & (frequencies <= upper)
+        bands.insert(0, (frequencies[band], psd[..., band]))
+        upper = lower
+    frequencies = np.concatenate([band[0] for band in bands])
+    psd = np.concatenate([band[1] for band in bands], axis=-1)
+    nsd_profile.count('bins', len(frequencies))
+    # transform PSD to NSD
+    return (frequencies, psd**0.5)
+
+def equivalent_averages(window, noverlap: int, count: int) -> float:
+    """Equivalent number of independent averages of a Welch estimate with overlapping segments
+
+    Overlapping segments are correlated, so the variance drops slower than 1/count. After Percival & Walden:
+    count / (1 + 2 sum_m (1 - m/count) rho(m)^2), rho(m) the window correlation of segments m steps apart.
+    The degrees of freedom of the chi-squared distribution of the PSD are twice this value.
+
+    Parameters:
+    -----------
+    window : array_like
+        values of the window function, its length is the segment length
+
+    noverlap : int
+        number of overlapping samples of consecutive segments
+
+    count : int
+        number of segments
+
+    Returns
+    -------
+    out : float
+        equivalent number of averages, count without overlap
+    """
+    window = np.asarray(window, dtype=np.float64)
+    step = len(window) - noverlap
+    shifts = np.arange(1, min(count, -(-len(window) // step)))
+    rho = np.array([np.dot(window[shift * step:], window[:len(window) - shift * step]) for shift in shifts])
+    rho /= np.dot(window, window)
+    return count / (1 + 2 * np.sum((1 - shifts / count) * rho**2))
+
+@nsd_profile.staged('get_confidence')
+def get_confidence(
+    ts_values: tuple,
+    sample_frequency: float,
+    nsd_bins: int=None,
+    window_function=window_HFT90D,
+    crop=np.s_[3:-1],
+    confidence: float=0.95,
+    bootstrap: int=None,
+    seed: int=None,
+    workers: int=None,
+    block_size: int=2**22,
+):
+    """NSD with confidence band, see get()
+
+    By default the band is the chi-squared interval of the PSD with 2 * equivalent_averages() degrees of freedom,
+    which takes the overlap of the window into account and costs nothing extra. With bootstrap the per-segment
+    periodograms are resampled: every resample is a multinomial weighting of the segments, all resamples are
+    one matrix product (split over workers threads). The segment bootstrap ignores the overlap correlation and
+    tends to give a slightly narrower band than the chi-squared interval.
+
+    Parameters:
+    -----------
+
+    ts_values : array_like
+        Time series of the signal (amplitude), time along the last axis
+
+    sample_frequency : int/float
+        The sample frequency in Hz (SPS - Samples per second)
+
+    nsd_bins : int, optional
+        number of NSD bins (points) to be calculated
+        default: 1/4 count of ts_values
+
+    window_function : function(length: int), optional
+        default: window_HFT90D
+
+    crop : slice, optional
+        default: the last and the first 3 NSD values are dropped as they are not reliable
+
+    confidence : float, optional
+        confidence level of the band
+        default: 0.95
+
+    bootstrap : int, optional
+        number of bootstrap resamples, the per-segment periodograms are kept in memory
+        default: None, chi-squared interval
+
+    seed : int, optional
+        seed of the bootstrap resampling
+        default: None
+
+    workers : int, optional
+        number of threads for the periodograms (see periodogram_sum) and the bootstrap
+        default: None, serial
+
+    block_size : int, optional
+        number of segment samples to be transformed at once
+        default: 2**22
+
+    Returns
+    -------
+    out : [array, array, array, array]
+        The frequencies (index 0), the NSD values (index 1) and the lower (index 2) and upper (index 3) band
+    """
+    if nsd_bins is None:
+        nsd_bins = int(np.shape(ts_values)[-1]/4)
+    noverlap, window = cached_window(window_function, nsd_bins)
+    frequencies = fft.rfftfreq(nsd_bins, 1 / sample_frequency)[crop]
+    alpha = (1 - confidence) / 2
+    if bootstrap is None:
+        from scipy import stats
+        psd_sum, count = periodogram_sum(ts_values, sample_frequency, window, noverlap, block_size, workers)
+        psd = psd_sum[..., crop] / count
+        freedom = 2 * equivalent_averages(window, noverlap, count)
+        lower = psd * freedom / stats.chi2.ppf(1 - alpha, freedom)
+        upper = psd * freedom / stats.chi2.ppf(alpha, freedom)
+        return (frequencies, psd**0.5, lower**0.5, upper**0.5)
+
+    ts_segments = segments(np.asarray(ts_values), nsd_bins, noverlap)
+    count = ts_segments.shape[-2]
+    block = max(1, block_size // nsd_bins)
+    psds = np.concatenate([periodograms(ts_segments[..., start:start + block, :], window, sample_frequency)[..., crop]
+                           for start in range(0, count, block)], axis=-2)
+    weights = np.random.default_rng(seed).multinomial(count, np.full(count, 1 / count), size=bootstrap) / count
+
+    def resample(rows):
+        return np.einsum('bk,...kf->b...f', weights[rows], psds)
+
+    if workers is None or workers <= 1:
+        resamples = resample(np.s_[:])
+    else:
+        rows = [np.s_[start:start + -(-bootstrap // workers)] for start in range(0, bootstrap, -(-bootstrap // workers))]
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            resamples = np.concatenate(list(executor.map(resample, rows)))
+    lower, upper = np.quantile(resamples, [alpha, 1 - alpha], axis=0)
+    return (frequencies, psds.mean(axis=-2)**0.5, lower**0.5, upper**0.5)
+
+@nsd_profile.staged('get_timeresolved')
+def get_timeresolved(
+    ts_values: tuple,
+    sample_frequency: float,
+    frame_length: int,
+    nsd_bins: int=None,
+    window_function=window_HFT90D,
+    crop=np.s_[3:-1],
+    smooth_bins: int=None,
+    filename: str=None,
+    block_size: int=2**22,
+):
+    """Time-resolved NSD (spectrogram): the NSD of consecutive frames of the time series
+
+    Each row equals get() of one frame of frame_length samples (trailing samples are ignored). All frames are
+    done in one strided pass over the series with one window, in blocks of about block_size samples.
+
+    Parameters:
+    -----------
+
+    ts_values : array_like
+        Time series of the signal (amplitude), e.g. a memory map, see nsd_io
+
+    sample_frequency : int/float
+        The sample frequency in Hz (SPS - Samples per second)
+
+    frame_length : int
+        number of samples per frame
+
+    nsd_bins : int, optional
+        number of NSD bins (samples per segment)
+        default: 1/4 frame_length
+
+    window_function : function(length: int), optional
+        default: window_HFT90D
+
+    crop : slice, optional
+        default: the last and the first 3 NSD values are dropped as they are not reliable
+
+    smooth_bins : int, optional
+        reduce each frame to log spaced bins with smooth(frame, smooth_bins)
+        default: None, linear spaced bins
+
+    filename : str, optional
+        stream the NSD matrix to this .npy file (memory map) instead of keeping it in RAM
+        default: None
+
+    block_size : int, optional
+        number of segment samples to be processed at once
+        default: 2**22
+
+    Returns
+    -------
+    out : [array, array, array]
+        The frame center times in s (index 0), the frequencies (index 1) and the NSD values as frames x frequencies (index 2)
+    """
+    frames = len(ts_values) // frame_length
+    if nsd_bins is None:
+        nsd_bins = int(frame_length/4)
+    noverlap, window = cached_window(window_function, nsd_bins)
+    ts_segments = segments(np.asarray(ts_values)[:frames * frame_length].reshape(frames, frame_length), nsd_bins, noverlap)
+    frequencies = fft.rfftfreq(nsd_bins, 1 / sample_frequency)[crop]
+    if smooth_bins is not None:
+        frequencies = smooth((frequencies, frequencies), smooth_bins)[0]
+    if filename is None:
+        nsd = np.empty((frames, len(frequencies)))
+    else:
+        nsd = np.lib.format.open_memmap(filename, mode='w+', dtype=np.float64, shape=(frames, len(frequencies)))
+    block = max(1, block_size // (ts_segments.shape[-2] * nsd_bins))
+    for start in range(0, frames, block):
+        values = periodograms(ts_segments[start:start + block], window, sample_frequency).mean(axis=-2)[..., crop]**0.5
+        if smooth_bins is not None:
+            values = smooth((fft.rfftfreq(nsd_bins, 1 / sample_frequency)[crop], values), smooth_bins)[1]
+        nsd[start:start + block] = values
+    if filename is not None:
+        nsd.flush()
+    times = (np.arange(frames) + 0.5) * frame_length / sample_frequency
+    return (times, frequencies, nsd)
+
+def get_many(
+    ts_values: tuple,
+    sample_frequency: float,
+    nsd_bins: int=None,
+    window_function=window_HFT90D,
+    crop=np.s_[3:-1],
+    workers: int=None,
+    dtype=None,
+):
+    """Estimation of the NSDs of many channels in one vectorized pass, see get()
+
+    All channels share one window and one frequency axis.
+
+    Parameters:
+    -----------
+
+    ts_values : array_like
+        Time series of the signals (amplitude), 2-D: channels x samples
+
+    sample_frequency : int/float
+        The sample frequency in Hz (SPS - Samples per second)
+
+    nsd_bins : int, optional
+        number of NSD bins (points) to be calculated
+        default: 1/4 count of samples per channel
+
+    window_function : function(length: int), optional
+        default: window_HFT90D
+
+    crop : slice, optional
+        default: the last and the first 3 NSD values are dropped as they are not reliable
+
+    workers : int, optional
+        number of threads, see get()
+        default: None, serial
+
+    dtype : data-type, optional
+        compute data-type, see get()
+        default: None, float64
+
+    Returns
+    -------
+    out : [array, array]
+        The frequencies (index 0) and the corresponding NSD values (index 1) stacked as channels x frequencies
+    """
+    ts_values = np.atleast_2d(ts_values)
+    if ts_values.ndim != 2:
+        raise ValueError(f'ts_values needs to be 2-D (channels x samples), got {ts_values.ndim}-D')
+    return get(ts_values, sample_frequency, nsd_bins, window_function, crop, workers=workers, dtype=dtype)
+
+@nsd_profile.staged('get_csd')
+def get_csd(
+    ts_values: tuple,
+    sample_frequency: float,
+    nsd_bins: int=None,
+    window_function=window_HFT90D,
+    crop=np.s_[3:-1],
+    block_size: int=2**22,
+):
+    """Cross spectral density matrix of many channels, e.g. to separate common-mode from per-channel noise
+
+    Each segment of each channel is transformed once, the channels x channels matrix is the averaged outer
+    product of the spectra. The segments, window and overlap follow get(), entry [i, j] matches
+    signal.csd(ts_values[i], ts_values[j]) and the diagonal is the PSD (get() squared).
+
+    Parameters:
+    -----------
+
+    ts_values : array_like
+        Time series of the signals (amplitude), 2-D: channels x samples
+
+    sample_frequency : int/float
+        The sample frequency in Hz (SPS - Samples per second)
+
+    nsd_bins : int, optional
+        number of NSD bins (samples per segment)
+        default: 1/4 count of samples per channel
+
+    window_function : function(length: int), optional
+        default: window_HFT90D
+
+    crop : slice, optional
+        default: the last and the first 3 values are dropped as they are not reliable
+
+    block_size : int, optional
+        number of segment samples (all channels) to be transformed at once
+        default: 2**22
+
+    Returns
+    -------
+    out : [array, array]
+        The frequencies (index 0) and the complex CSD in V^2/Hz as channels x channels x frequencies (index 1)
+    """
+    ts_values = np.atleast_2d(ts_values)
+    if ts_values.ndim != 2:
+        raise ValueError(f'ts_values needs to be 2-D (channels x samples), got {ts_values.ndim}-D')
+    if nsd_bins is None:
+        nsd_bins = int(ts_values.shape[-1]/4)
+    noverlap, window = cached_window(window_function, nsd_bins)
+    ts_segments = segments(ts_values, nsd_bins, noverlap)
+    channels, count = ts_segments.shape[:2]
+    csd = np.zeros((channels, channels, nsd_bins//2 + 1), dtype=complex)
+    block = max(1, block_size // (channels * nsd_bins))
+    for start in range(0, count, block):
+        spectrum = spectra(ts_segments[:, start:start + block], window)
+        csd += np.einsum('ckf,dkf->cdf', spectrum.conj(), spectrum)
+    csd = one_sided(csd, window, sample_frequency) / count
+    return (fft.rfftfreq(nsd_bins, 1 / sample_frequency)[crop], csd[..., crop])
+
+def coherence(ordered_csd):
+    """Magnitude squared coherence |Pxy|^2 / (Pxx Pyy) of all channel pairs
+
+    Parameters:
+    -----------
+    ordered_csd : [array, array]
+        frequencies & CSD matrix, see get_csd()
+
+    Returns
+    -------
+    out : [array, array]
+        The frequencies (index 0) and the coherence (0 to 1) as channels x channels x frequencies (index 1)
+    """
+    csd = ordered_csd[1]
+    psd = np.diagonal(csd).real.T  # channels x frequencies
+    return (ordered_csd[0], (csd.real**2 + csd.imag**2) / (psd[:, None, :] * psd[None, :, :]))
+
+def phasor(omega: float, length: int):
+    """exp(1j * omega * n) for n < length from an outer product of two short exponentials
+
+    About 2 * length**0.5 complex exponentials instead of length, rounding errors stay ~1e-15.
+    """
+    columns = int(np.ceil(length**0.5))
+    rows = -(-length // columns)
+    return np.outer(np.exp(1j * omega * columns * np.arange(rows)), np.exp(1j * omega * np.arange(columns))).ravel()[:length]
+
+@nsd_profile.staged('get_lpsd')
+def get_lpsd(
+    ts_values: tuple,
+    sample_frequency: float,
+    nsd_bins: int=64,
+    window_function=window_HFT90D,
+    frequency_range: tuple=None,
+    max_averages: int=300,
+    decimation: int=8,
+    min_bin: float=6,
+    block_size: int=2**22,
+):
+    """Estimation of the NSD at log spaced frequencies with the LPSD method
+
+    LPSD - from https://holometer.fnal.gov/GH_FFT.pdf: each frequency gets its own segment length,
+    so its resolution is proportional to the frequency. The DFT is computed at that single frequency for all
+    (overlapping) segments, detrended & scaled like get(). No full length FFT segments or linear spaced bins are
+    computed, see get() & smooth().
+
+    Parameters:
+    -----------
+
+    ts_values : array_like
+        Time series of the signal (amplitude)
+
+    sample_frequency : int/float
+        The sample frequency in Hz (SPS - Samples per second)
+
+    nsd_bins : int, optional
+        number of log spaced NSD points
+        default: 64
+
+    window_function : function(length: int), optional
+        default: window_HFT90D
+
+    frequency_range : [float, float], optional
+        lowest & highest frequency in Hz
+        default: [16 * sample_frequency / len(ts_values), 0.45 * sample_frequency]
+
+    max_averages : int, optional
+        upper limit of segments per frequency, every n-th segment (strided view) evenly spread over the series.
+        The high frequencies have short segments & thousands of them, the cap bounds their compute
+        default: 300, None for all segments
+
+    decimation : int, optional
+        low-pass filter & decimate the series by this factor (repeatedly) for the low frequencies, which are well
+        inside the passband, so their long segments cost a fraction of the samples. The filter gain is corrected
+        default: 8, None computes all frequencies at the sample frequency
+
+    min_bin : float, optional
+        lowest DFT bin of each frequency in its own segment (r_min of the LPSD paper), at least the half main lobe
+        width of the window in bins, else the mean removal cuts into the main lobe & the NSD is too low.
+        With few nsd_bins the resolution is narrowed to frequency / min_bin
+        default: 6 (HFT90D main lobe: ±5 bins)
+
+    block_size : int, optional
+        number of segment samples to be processed at once
+        default: 2**22
+
+    Returns
+    -------
+    out : [array, array]
+        The frequencies (index 0) and the corresponding NSD values (index 1)
+    """
+    ts_values = np.asarray(ts_values)
+    samples = len(ts_values)
+    if frequency_range is None:
+        frequency_range = (16 * sample_frequency / samples, 0.45 * sample_frequency)
+    frequencies = np.geomspace(frequency_range[0], frequency_range[1], nsd_bins)
+    growth = (frequency_range[1] / frequency_range[0])**(1 / (nsd_bins - 1))
+    resolution = np.maximum(np.minimum(frequencies * (growth - 1), frequencies / min_bin), sample_frequency / samples)
+
+    psd = np.empty(nsd_bins)
+    rate = sample_frequency
+    rates = []
+    for j in reversed(range(nsd_bins)):
+        frequency = frequencies[j]
+        # the long segments of the low frequencies are computed on a decimated series, like get(..., cascade)
+        while decimation and frequency + 5 * resolution[j] < 0.4 * rate / decimation and len(ts_values) >= 2**12 * decimation:
+            if not rates:
+                with nsd_profile.stage('import'):
+                    from scipy import signal
+                # the anti-aliasing filter of signal.decimate, applied here to correct its passband ripple below
+                sos = signal.cheby1(8, 0.05, 0.8 / decimation, output='sos')
+            with nsd_profile.stage('decimate'):
+                ts_values = signal.sosfiltfilt(sos, ts_values)[::decimation]
+            rates.append(rate)
+            rate /= decimation
+        length = min(int(round(rate / resolution[j])), len(ts_values))
+        if length < 8:
+            raise ValueError(f'segment of {length} samples at {frequency} Hz, lower the frequency_range or raise min_bin')
+        noverlap, window = window_function(length)
+        rotation = phasor(2.0 * np.pi * frequency / rate, length)
+        # the mean (detrend) is computed in the same pass as the DFT at the frequency
+        kernel = np.stack((window * rotation.real, window * rotation.imag, np.full(length, 1 / length)))
+        kernel_sum = kernel[:2].sum(axis=-1)
+        ts_segments = segments(ts_values, length, noverlap)
+        if max_averages is not None and len(ts_segments) > max_averages:
+            ts_segments = ts_segments[::-(-len(ts_segments) // max_averages)]  # strided view, no copy
+        nsd_profile.count('segments', len(ts_segments))  # a DFT at one frequency each, no FFT
+        block = max(1, block_size // length)
+        power = 0.0
+        for start in range(0, len(ts_segments), block):
+            # einsum works on the strided view, no copy of the overlapping segments
+            products = np.einsum('kl,cl->kc', ts_segments[start:start + block], kernel)
+            spectrum = products[:, :2] - products[:, 2:] * kernel_sum
+            power += (spectrum**2).sum()
+        psd[j] = 2 * power / (len(ts_segments) * rate * (window * window).sum())
+        for stage_rate in rates:
+            psd[j] /= np.abs(signal.sosfreqz(sos, [frequency], fs=stage_rate)[1][0])**4  # forward & backward
+    return (frequencies, psd**0.5)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# developed & tested with Python 3.9
+
+"""asyncio pipeline around the NSD core: acquisition, spectral work & consumers run concurrently
+
+    async def main():
+        pipeline = nsd_async.Pipeline(sample_frequency=50, nsd_bins=2**12)
+        await pipeline.run(instrument_blocks(), consumer=print_corner)
+
+The source (async iterable of sample blocks) feeds a bounded queue, its size limits the memory when the
+spectral work falls behind (backpressure: the source awaits a free slot). The FFTs (nsd_stream.Accumulator)
+and the fit run in an executor, so the event loop keeps reading the instrument while they run.
+"""
+
+import asyncio
+import inspect
+import contextlib
+import numpy as np
+import nsd
+import nsd_stream
+import nsd_helper
+
+
+async def simulated_source(
+    samples: int,
+    block_size: int,
+    sample_frequency: float=50,
+    noise_types=['white', 'brownian'],
+    seed: int=4,
+    realtime: bool=False,
+):
+    """Simulated instrument: yields blocks of colored noise, see nsd_helper.nsd_noise_chunks
+
+    Parameters:
+    -----------
+    samples : int
+        total number of samples
+
+    block_size : int
+        samples per block
+
+    sample_frequency : int/float, optional
+        The sample frequency in Hz (SPS - Samples per second)
+        default: 50
+
+    noise_types, seed :
+        see nsd_helper.nsd_noise_chunks
+
+    realtime : bool, optional
+        pace the blocks like an instrument: one block every block_size / sample_frequency seconds
+        default: False, as fast as possible (still yielding to the event loop between blocks)
+
+    Yields
+    ------
+    out : array
+        next block of samples
+    """
+    interval = block_size / sample_frequency if realtime else 0
+    for block in nsd_helper.nsd_noise_chunks(samples, block_size, noise_types, sample_frequency, seed=seed):
+        await asyncio.sleep(interval)
+        yield block
+
+
+class Pipeline:
+    """Concurrent acquisition & NSD: source -> bounded queue -> executor (FFT, fit) -> consumer
+
+    Parameters:
+    -----------
+
+    sample_frequency : int/float
+        The sample frequency in Hz (SPS - Samples per second)
+
+    nsd_bins : int
+        number of NSD bins (samples per segment)
+
+    window_function : function(length: int), optional
+        see nsd.get
+        default: nsd.window_HFT90D
+
+    crop : slice, optional
+        default: the last and the first 3 NSD values are dropped as they are not reliable
+
+    queue_size : int, optional
+        maximum number of blocks waiting for the spectral work
+        default: 16
+
+    update_every : int, optional
+        blocks between results to the consumer
+        default: 1
+
+    fit_bins : int, optional
+        smooth() the NSD to fit_bins log spaced bins and fit it (nsd.fit_corner), None for no fit
+        default: 64
+
+    executor : concurrent.futures.Executor, optional
+        runs the FFTs & the fit
+        default: None, the default executor of the event loop (threads)
+    """
+
+    def __init__(
+        self,
+        sample_frequency: float,
+        nsd_bins: int,
+        window_function=nsd.window_HFT90D,
+        crop=np.s_[3:-1],
+        queue_size: int=16,
+        update_every: int=1,
+        fit_bins: int=64,
+        executor=None,
+    ):
+        self.accumulator = nsd_stream.Accumulator(sample_frequency, nsd_bins, window_function, crop)
+        self.queue_size = queue_size
+        self.update_every = update_every
+        self.fit_bins = fit_bins
+        self.executor = executor
+        self.blocks = 0
+        self.samples = 0
+        self.max_queued = 0
+
+    async def run(self, source, consumer=None):
+        """Process all blocks of source, consumer(result) gets every update_every blocks the current result
+
+        Parameters:
+        -----------
+        source : async iterable (or iterable) of array_like
+            sample blocks, e.g. simulated_source()
+
+        consumer : function(result: dict) or coroutine function, optional
+            result: {'blocks', 'samples', 'nsd': [frequencies, NSD values], 'fit': nsd.fit_corner() or None}
+            default: None
+
+        Returns
+        -------
+        out : [array, array]
+            The frequencies (index 0) and the NSD values (index 1) of all samples
+        """
+        queue = asyncio.Queue(self.queue_size)
+        producer = asyncio.ensure_future(self._produce(source, queue))
+        try:
+            await self._process(queue, consumer)
+        except BaseException:
+            producer.cancel()
+            with contextlib.suppress(Exception, asyncio.CancelledError):
+                await producer  # finished before the error of the processing is raised, no pending task is left
+            raise
+        await producer  # raises errors of the source
+        return self.accumulator.get()
+
+    async def _produce(self, source, queue):
+        try:
+            if not hasattr(source, '__aiter__'):
+                source = _iterate(source)
+            async for block in source:
+                await queue.put(np.asarray(block, dtype=float))
+                self.max_queued = max(self.max_queued, queue.qsize())
+        except Exception:
+            await queue.put(None)  # stop the processing, the error is raised by run()
+            raise
+        await queue.put(None)  # end of source
+
+    async def _process(self, queue, consumer):
+        loop = asyncio.get_running_loop()
+        while True:
+            block = await queue.get()
+            if block is None:
+                break
+            await loop.run_in_executor(self.executor, self.accumulator.push, block)
+            self.blocks += 1
+            self.samples += len(block)
+            if consumer is not None and self.blocks % self.update_every == 0 and self.accumulator.segments:
+                result = await loop.run_in_executor(self.executor, self.result)
+                outcome = consumer(result)
+                if inspect.isawaitable(outcome):
+                    await outcome
+
+    def result(self) -> dict:
+        """Current result, see run()"""
+        nsd_values = self.accumulator.get()
+        fit = None
+        if self.fit_bins is not None:
+            fit = nsd.fit_corner(nsd.smooth(nsd_values, self.fit_bins))
+        return {'blocks': self.blocks, 'samples': self.samples, 'nsd': nsd_values, 'fit': fit}
+
+
+async def _iterate(blocks):
+    for block in blocks:
+        yield block
+        await asyncio.sleep(0)
+
+
+def run(source, sample_frequency: float, nsd_bins: int, consumer=None, **kwargs):
+    """Run a Pipeline on source in a new event loop (asyncio.run), see Pipeline
+
+    Returns
+    -------
+    out : [array, array]
+        The frequencies (index 0) and the NSD values (index 1) of all samples
+    """
+    return asyncio.run(Pipeline(sample_frequency, nsd_bins, **kwargs).run(source, consumer))
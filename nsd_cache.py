@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# developed & tested with Python 3.9
+
+"""On-disk cache for NSD computations, keyed by a content hash of the time series and all parameters"""
+
+import os
+import glob
+import hashlib
+import zipfile
+import tempfile
+import numpy as np
+import nsd
+
+
+def function_name(function) -> str:
+    """Stable name of a function for cache keys, e.g. 'nsd.window_HFT90D'
+
+    Lambdas & local functions (closures) share their name, e.g. '__main__.<lambda>', their key adds the
+    bytecode, constants, defaults and closure values, so two different lambdas get different keys.
+    """
+    name = f'{getattr(function, "__module__", "")}.{getattr(function, "__qualname__", repr(function))}'
+    code = getattr(function, '__code__', None)
+    if code is None or ('<lambda>' not in name and '<locals>' not in name):
+        return name
+    closure = [cell.cell_contents for cell in function.__closure__ or ()]
+    values = [parameter_key(value) for value in (function.__defaults__ or ()) + tuple(closure)]
+    return f'{name}:{code_key(code)}:{values}'
+
+def code_key(code) -> str:
+    """Bytecode, names & constants of a code object, nested code objects (e.g. inner lambdas) included"""
+    constants = [code_key(constant) if hasattr(constant, 'co_code') else repr(constant) for constant in code.co_consts]
+    return f'{code.co_code.hex()}:{code.co_names}:{constants}'
+
+def parameter_key(parameter) -> str:
+    """Stable key of a parameter: functions by function_name, arrays by content_hash, everything else by repr"""
+    if callable(parameter):
+        return function_name(parameter)
+    if isinstance(parameter, np.ndarray):
+        return content_hash(parameter)
+    return repr(parameter)
+
+def content_hash(values: tuple, *parameters) -> str:
+    """Hash (blake2b) of the buffer of values, its dtype & shape and the repr of parameters
+
+    Parameters:
+    -----------
+    values : array_like
+        e.g. time series, memory maps are hashed chunk by chunk without loading them at once
+
+    parameters :
+        anything with a stable repr, functions are hashed by module & name (lambdas & closures by code, see function_name)
+
+    Returns
+    -------
+    out : str
+        hex digest
+    """
+    values = np.asarray(values)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(repr((values.dtype.str, values.shape)).encode())
+    flat = values.reshape(-1)
+    step = max(1, 2**24 // max(1, values.itemsize))
+    for start in range(0, len(flat), step):
+        digest.update(np.ascontiguousarray(flat[start:start + step]).data)
+    for parameter in parameters:
+        digest.update(repr(parameter_key(parameter) if callable(parameter) else parameter).encode())
+    return digest.hexdigest()
+
+
+class Cache:
+    """Opt-in on-disk cache around nsd.get & nsd.smooth
+
+    Results are stored as compressed .npz files in directory, keyed by a hash of the input buffer and all
+    parameters that change the result. When the cache grows above max_bytes, the least recently used
+    files are evicted.
+
+    Parameters:
+    -----------
+
+    directory : str
+        cache directory, created if missing
+
+    max_bytes : int, optional
+        size limit of the cache directory
+        default: 2**30 (1 GiB)
+    """
+
+    def __init__(self, directory: str, max_bytes: int=2**30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def get_key(
+        self,
+        ts_values: tuple,
+        sample_frequency: float,
+        nsd_bins: int=None,
+        window_function=nsd.window_HFT90D,
+        crop=np.s_[3:-1],
+        **kwargs,
+    ) -> str:
+        """Cache key of get() for these arguments, see invalidate()"""
+        kwargs.pop('workers', None)  # does not change the result
+        return content_hash(ts_values, 'get', float(sample_frequency), nsd_bins, window_function, crop,
+                            sorted(kwargs.items()))
+
+    def get(
+        self,
+        ts_values: tuple,
+        sample_frequency: float,
+        nsd_bins: int=None,
+        window_function=nsd.window_HFT90D,
+        crop=np.s_[3:-1],
+        **kwargs,
+    ):
+        """nsd.get, loaded from the cache if computed before
+
+        Parameters:
+        -----------
+        see nsd.get, further keyword arguments (cascade, decimation, workers, dtype) are passed on
+
+        Returns
+        -------
+        out : [array, array]
+            The frequencies (index 0) and the corresponding NSD values (index 1)
+        """
+        key = self.get_key(ts_values, sample_frequency, nsd_bins, window_function, crop, **kwargs)
+        return self._cached(key, nsd.get, ts_values, sample_frequency, nsd_bins, window_function, crop, **kwargs)
+
+    def smooth(self, ordered_nsd, nsd_bins: int=64, filter_function=np.mean, **kwargs):
+        """nsd.smooth, loaded from the cache if computed before
+
+        Parameters:
+        -----------
+        see nsd.smooth, further keyword arguments (overlap, percentile) are passed on
+
+        Returns
+        -------
+        out : [array, array]
+            The frequencies (index 0) and the corresponding smoothed NSD values (index 1)
+        """
+        key = content_hash(np.concatenate((np.ravel(ordered_nsd[0]), np.ravel(ordered_nsd[1]))), 'smooth',
+                           np.shape(ordered_nsd[1]), nsd_bins, filter_function, sorted(kwargs.items()))
+        return self._cached(key, nsd.smooth, ordered_nsd, nsd_bins, filter_function, **kwargs)
+
+    def invalidate(self, key: str=None):
+        """Remove one cached result (key from get_key) or, without key, all cached results"""
+        paths = [self._path(key)] if key is not None else glob.glob(os.path.join(self.directory, '*.npz'))
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def size(self) -> int:
+        """Size of all cached results in bytes"""
+        return sum(os.path.getsize(path) for path in glob.glob(os.path.join(self.directory, '*.npz')))
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.npz')
+
+    def _cached(self, key, function, *args, **kwargs):
+        path = self._path(key)
+        if os.path.exists(path):
+            try:
+                # own file handle: np.load leaves the file open when a truncated .npz fails, os.remove fails on Windows
+                with open(path, 'rb') as file, np.load(file) as data:
+                    result = (data['frequencies'], data['nsd'])
+                os.utime(path)  # most recently used
+                self.hits += 1
+                return result
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+                os.remove(path)  # damaged or truncated, recompute
+        self.misses += 1
+        frequencies, values = function(*args, **kwargs)
+        file, temporary = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(file, 'wb') as output:
+                np.savez_compressed(output, frequencies=frequencies, nsd=values)
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)  # e.g. disk full, no partial file is left behind
+            raise
+        self._evict()
+        return (np.asarray(frequencies), np.asarray(values))
+
+    def _evict(self):
+        paths = sorted(glob.glob(os.path.join(self.directory, '*.npz')), key=os.path.getmtime)
+        sizes = [os.path.getsize(path) for path in paths]
+        total = sum(sizes)
+        for path, size in zip(paths[:-1], sizes):  # keep the newest
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
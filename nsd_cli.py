@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# developed & tested with Python 3.9
+
+"""Command line batch processing: NSD, RMS & 1/f fit of many capture files in a process pool
+
+    python nsd_cli.py "captures/*.csv" --sample-rate 50 --nsd-bins 4096 --smooth 64 --workers 8 --output summary.csv
+
+One row per file is written to the summary CSV: samples, series_rms, nsd_rms and the fit (slope, freq_exp,
+white, corner). With --nsd-output the NSDs are saved to a .npz as well.
+"""
+
+import sys
+import os
+import csv
+import glob
+import time
+import argparse
+import contextlib
+import concurrent.futures
+import numpy as np
+import nsd
+import nsd_io
+import nsd_profile
+
+windows = {'HFT90D': nsd.window_HFT90D, 'flattop': nsd.window_flattop}
+filters = {'mean': np.mean, 'median': np.median}
+columns = ['file', 'samples', 'series_rms', 'nsd_rms', 'slope', 'freq_exp', 'white', 'corner', 'error']
+
+
+def load(path: str, options):
+    """Time series of a capture file by extension: .npy & raw binary are memory mapped, everything else is read as CSV"""
+    if path.endswith('.npy'):
+        values = nsd_io.memmap_npy(path)
+    elif path.endswith(('.bin', '.raw', '.dat')):
+        values = nsd_io.memmap_binary(path, options.dtype, options.header)
+    else:
+        return np.concatenate(list(nsd_io.csv_chunks(path, options.column, options.sep, options.skiprows,
+                                                     scale=options.scale, offset=options.offset)))
+    if values.ndim != 1:
+        raise ValueError(f'need a 1-D time series, got shape {values.shape}')
+    if options.scale == 1.0 and options.offset == 0.0 and values.dtype.kind == 'f':
+        return values
+    return values * options.scale + options.offset
+
+def process(path: str, options):
+    """NSD, RMS & fit of one capture file, errors are reported in the row instead of stopping the batch
+
+    Returns
+    -------
+    out : [dict, [array, array], dict]
+        summary row (index 0), the NSD, smoothed with --smooth, None on errors (index 1)
+        and the nsd_profile report with --profile (index 2)
+    """
+    row = dict.fromkeys(columns, np.nan)
+    row.update(file=path, error='')
+    with nsd_profile.Profile(memory=options.profile == 'memory') if options.profile else contextlib.nullcontext() as profile:
+        row, nsd_values = _process(path, options, row)
+    return row, nsd_values, profile.report() if options.profile else None
+
+def _process(path, options, row):
+    try:
+        with nsd_profile.stage('load'):
+            ts_values = load(path, options)
+        nsd_bins = options.nsd_bins
+        if options.fast:
+            plan = nsd.plan(len(ts_values), options.sample_rate, nsd_bins, windows[options.window])
+            ts_values, nsd_bins = nsd.planned(ts_values, plan), plan['nsd_bins']
+        nsd_values = nsd.get(ts_values, options.sample_rate, nsd_bins, windows[options.window])
+        row.update(samples=len(ts_values), series_rms=nsd.series_rms(ts_values), nsd_rms=nsd.nsd_rms(nsd_values))
+        if options.smooth:
+            nsd_values = nsd.smooth(nsd_values, options.smooth, filters[options.filter])
+        if not options.no_fit:
+            slope, freq_exp, white, _, corner = nsd.fit_corner(nsd_values)
+            row.update(slope=slope, freq_exp=freq_exp, white=white, corner=corner)
+    except Exception as error:  # one broken file must not stop the batch
+        row['error'] = f'{type(error).__name__}: {error}'
+        nsd_values = None
+    return row, nsd_values
+
+def files(patterns) -> list:
+    """Sorted unique file names matching the glob patterns (recursive ** supported)"""
+    return sorted({path for pattern in patterns for path in glob.glob(pattern, recursive=True) if os.path.isfile(path)})
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='NSD, RMS & 1/f fit of many capture files')
+    parser.add_argument('patterns', nargs='+', help='capture files or glob patterns, e.g. "captures/**/*.csv"')
+    parser.add_argument('--sample-rate', type=float, required=True, help='sample frequency in Hz')
+    parser.add_argument('--nsd-bins', type=int, default=None, help='samples per segment (default: 1/4 of the samples)')
+    parser.add_argument('--window', choices=windows, default='HFT90D')
+    parser.add_argument('--fast', action='store_true', help='nearest fast FFT length to --nsd-bins & trimmed series, see nsd.plan')
+    parser.add_argument('--smooth', type=int, default=None, help='log spaced bins for smooth() before fitting & saving')
+    parser.add_argument('--filter', choices=filters, default='mean', help='filter function of --smooth')
+    parser.add_argument('--no-fit', action='store_true', help='skip the 1/f fit')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes (default: CPU count)')
+    parser.add_argument('--output', default='nsd_summary.csv', help='summary CSV (default: nsd_summary.csv)')
+    parser.add_argument('--nsd-output', default=None, help='.npz for the NSDs (frequencies_<n>, nsd_<n>, files)')
+    parser.add_argument('--quiet', action='store_true', help='no progress on stderr')
+    parser.add_argument('--profile', nargs='?', const='time', choices=['time', 'memory'], default=None,
+                        help='print stage timings (and peak memory) of all files to stderr, see nsd_profile')
+    csv_options = parser.add_argument_group('CSV files')
+    csv_options.add_argument('--column', type=int, default=0, help='column of the values (default: 0)')
+    csv_options.add_argument('--sep', default=',', help='column separator (default: ,)')
+    csv_options.add_argument('--skiprows', type=int, default=1, help='header lines to skip (default: 1)')
+    binary_options = parser.add_argument_group('raw binary files (.bin, .raw, .dat)')
+    binary_options.add_argument('--dtype', default='int16', help='sample format, e.g. int16, >i4, float32 (default: int16)')
+    binary_options.add_argument('--header', type=int, default=0, help='bytes to skip (default: 0)')
+    parser.add_argument('--scale', type=float, default=1.0, help='value = sample * scale + offset (default: 1)')
+    parser.add_argument('--offset', type=float, default=0.0, help='value = sample * scale + offset (default: 0)')
+    return parser
+
+def main(argv=None) -> int:
+    options = parser().parse_args(argv)
+    paths = files(options.patterns)
+    if not paths:
+        print('no files match', file=sys.stderr)
+        return 1
+
+    results = [None] * len(paths)
+    start = time.perf_counter()
+
+    def done(count, path):
+        if not options.quiet:
+            print(f'[{count}/{len(paths)}] {time.perf_counter() - start:7.1f}s {path}', file=sys.stderr, flush=True)
+
+    if options.workers is None or options.workers <= 1:
+        for count, path in enumerate(paths, 1):
+            results[count - 1] = process(path, options)
+            done(count, path)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(options.workers) as executor:
+            futures = {executor.submit(process, path, options): index for index, path in enumerate(paths)}
+            for count, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                results[futures[future]] = future.result()
+                done(count, paths[futures[future]])
+
+    with open(options.output, 'w', newline='') as file:
+        writer = csv.DictWriter(file, columns)
+        writer.writeheader()
+        writer.writerows(row for row, _, _ in results)
+    if options.nsd_output is not None:
+        arrays = {'files': np.array(paths)}
+        for index, (_, nsd_values, _) in enumerate(results):
+            if nsd_values is not None:
+                arrays[f'frequencies_{index}'], arrays[f'nsd_{index}'] = nsd_values
+        np.savez_compressed(options.nsd_output, **arrays)
+
+    if options.profile:
+        profile = nsd_profile.Profile()
+        for _, _, report in results:
+            profile.merge(report)
+        print(profile.summary(), file=sys.stderr)
+    failed = sum(1 for row, _, _ in results if row['error'])
+    if not options.quiet:
+        print(f'{len(paths) - failed} of {len(paths)} files in {time.perf_counter() - start:.1f}s, summary: {options.output}',
+              file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,93 +4,178 @@
 
 """Little helper for NSD, e.g. noise & tone generators, nsd plot, engineering formatter"""
 
+import math
 import numpy as np
-import colorednoise as cn
-import matplotlib.pyplot as plt
-from matplotlib.ticker import EngFormatter
+import nsd_profile
 
-def nsd_noise(samples, noise_types=['white', 'brownian'], sps=50, corner=[0.1, 1e-9], seed=4):
+# colorednoise & matplotlib are imported where they are used, so eng() & iterable() do not pay for them
+
+def powerlaw_scale(exponent, samples, sps, corner):
+    '''scale of colorednoise.powerlaw_psd_gaussian (unit variance) to pass through the corner [Hz, V/sqrt(Hz)]
+    the expected one-sided NSD of the unit variance noise is (f/sps)^(-exponent/2) * (samples / (sps * sum(w^2)))^0.5
+    with w the spectral scaling factors colorednoise uses for its theoretical standard deviation
+    '''
+    f = np.fft.rfftfreq(samples)[1:]
+    w = np.maximum(f, 1. / samples)**(-exponent / 2.)
+    w[-1] *= (1 + (samples % 2)) / 2.
+    nsd_unit = (corner[0] / sps)**(-exponent / 2.) * (samples / (sps * np.sum(w**2)))**0.5
+    return corner[1] / nsd_unit
+
+@nsd_profile.staged('nsd_noise')
+def nsd_noise(samples, noise_types=['white', 'brownian'], sps=50, corner=[0.1, 1e-9], seed=4, dtype=np.float64, out=None):
     '''generate colored noise
     supported noise types are: white, white-pink, pink, brownian (1/f^(0; 0.5; 1; 2))
-    sps & corner is not supported atm - for 2^20 samples, 50 sps the corner is 0.1Hz at 1nV
+    corner [Hz, V/sqrt(Hz)]: the white noise NSD is corner[1], the colored noise NSDs pass through the corner,
+    for sps samples per second
+    dtype: data-type of the returned noise, e.g. np.float32
+    out: optional preallocated array (samples) the noise is added to
     '''
-    sum_noise = [0] * samples
+    import colorednoise as cn
+    sum_noise = np.zeros(samples, dtype=dtype) if out is None else out
     
     # backwards compatibility, breaks with v2.1
     np.random.seed(seed) # same result for each run
     def noise_function(exponent, samples):
         try:
-            return cn.powerlaw_psd_gaussian(exponent, samples, random_state=seed)
+            noise = cn.powerlaw_psd_gaussian(exponent, samples, random_state=seed)
         except:
-            return cn.powerlaw_psd_gaussian(exponent, samples)
+            noise = cn.powerlaw_psd_gaussian(exponent, samples)
+        noise *= powerlaw_scale(exponent, samples, sps, corner)
+        return noise.astype(sum_noise.dtype, copy=False)
 
 
     for noise_type in noise_types:
         match = False
         if noise_type == 'white':
-            sum_noise += noise_function(0, samples)/199.449e6
+            sum_noise += noise_function(0, samples)
             match = True
         if noise_type == 'white-pink':
-            sum_noise += noise_function(0.5, samples)/0.55e9
+            sum_noise += noise_function(0.5, samples)
             match = True
         if noise_type == 'pink':
-            sum_noise += noise_function(1, samples)/0.85e9
+            sum_noise += noise_function(1, samples)
             match = True
         if noise_type == 'brownian':
-            sum_noise += noise_function(2, samples)/4e7
+            sum_noise += noise_function(2, samples)
             match = True
         if match == False:
             raise ValueError(f'unsupported noise_type: {noise_type}')
 
     return sum_noise
 
-def tone(rms, freq, sps, samples):
-    '''generate a tone
+def nsd_noise_chunks(samples, chunk_size, noise_types=['white', 'brownian'], sps=50, corner=[0.1, 1e-9], seed=4, dtype=np.float64):
+    '''generate colored noise chunk by chunk for out-of-core runs, see nsd_noise
+    each chunk is an independent realisation (seed + chunk index): the white noise is exact,
+    the colored noise is only correlated within a chunk, so its NSD flattens below sps/chunk_size
     '''
-    ur = []
-    for i in range (0, samples):
-        t = i / sps
-        ur.append(rms * 2**0.5 * np.cos(2 * np.pi * freq * t))
-    return np.array(ur)
-
-def plot(values_list, title, filename=None):
+    for index, start in enumerate(range(0, samples, chunk_size)):
+        yield nsd_noise(min(chunk_size, samples - start), noise_types, sps, corner, seed + index, dtype)
+
+@nsd_profile.staged('tone')
+def tone(rms, freq, sps, samples, dtype=np.float64, start=0, out=None):
+    '''generate a tone: rms * 2^0.5 * cos(2 pi freq t)
+    rms & freq may be arrays to generate the sum of many tones
+    start: index of the first sample, for chunk by chunk generation
+    out: optional preallocated array (samples) the tones are added to
+    '''
+    t = (start + np.arange(samples)) / sps
+    ur = np.zeros(samples, dtype=dtype) if out is None else out
+    for tone_rms, tone_freq in zip(*np.broadcast_arrays(np.atleast_1d(rms), np.atleast_1d(freq))):
+        ur += (tone_rms * 2**0.5 * np.cos(2 * np.pi * tone_freq * t)).astype(ur.dtype, copy=False)
+    return ur
+
+def display_reduce(frequencies, values, columns=2000):
+    '''reduce a trace for display, keeping its visual envelope: min & max per log spaced column (pixel column)
+    frequencies need to be sorted, traces with up to 2 * columns points are returned unchanged
+    '''
+    frequencies, values = np.asarray(frequencies), np.asarray(values)
+    if len(frequencies) <= 2 * columns:
+        return frequencies, values
+    positive = frequencies > 0
+    edges = np.geomspace(frequencies[positive][0], frequencies[-1], columns + 1)
+    start = np.searchsorted(frequencies, edges[:-1])
+    start = np.unique(np.append(start[start < len(frequencies)], np.argmax(positive)))
+    column_min = np.minimum.reduceat(values, start)
+    column_max = np.maximum.reduceat(values, start)
+    stop = np.append(start[1:], len(frequencies)) - 1
+    # vertical min-max segment per column, at the first & last frequency of the column
+    return (np.column_stack((frequencies[start], frequencies[stop])).ravel(),
+            np.column_stack((column_min, column_max)).ravel())
+
+@nsd_profile.staged('plot')
+def plot(values_list, title, filename=None, columns=2000, headless=False, figure=None):
     '''plot NSDs
     optional: provide a filename to save plot as .png
+    columns: traces are reduced to min/max per log spaced column for display (display_reduce), None plots all points
+    headless: render with Agg without pyplot & GUI, e.g. batch export, the figure is not shown
+    figure: reuse a figure returned by a previous call instead of creating a new one
+    returns the figure
     '''
-    fig, ax = plt.subplots(figsize=(15, 10))
+    from matplotlib.ticker import EngFormatter
+    if figure is not None:
+        figure.clear()
+    elif headless:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        figure = Figure(figsize=(15, 10))
+        FigureCanvasAgg(figure)
+    else:
+        import matplotlib.pyplot as plt
+        figure = plt.figure(figsize=(15, 10))
+    ax = figure.add_subplot()
 
     for values in iterable(values_list):
-        plt.plot(values['nsd'][0], values['nsd'][1], '-', ms=1, lw=1, alpha=0.8, label=values['label'])
+        frequencies, nsd_values = values['nsd'][0], values['nsd'][1]
+        if columns is not None:
+            frequencies, nsd_values = display_reduce(frequencies, nsd_values, columns)
+        ax.plot(frequencies, nsd_values, '-', ms=1, lw=1, alpha=0.8, label=values['label'])
 
-    plt.title(title, fontsize=13)
-    plt.xlabel('frequency in Hz')
-    plt.ylabel(r'noise in V/$\sqrt{Hz}$')
+    ax.set_title(title, fontsize=13)
+    ax.set_xlabel('frequency in Hz')
+    ax.set_ylabel(r'noise in V/$\sqrt{Hz}$')
 
-    plt.loglog()
-    plt.grid(True, which="both")
+    ax.loglog()
+    ax.grid(True, which="both")
     
     formatter = EngFormatter(sep="")
-    plt.gca().xaxis.set_major_formatter(formatter)
-    plt.gca().yaxis.set_major_formatter(formatter)
-    plt.gca().yaxis.set_minor_formatter(formatter)
-    plt.legend()
-    fig.tight_layout()                                             # Adjust spacings w.r.t. figsize
+    ax.xaxis.set_major_formatter(formatter)
+    ax.yaxis.set_major_formatter(formatter)
+    ax.yaxis.set_minor_formatter(formatter)
+    ax.legend()
+    figure.tight_layout()                                          # Adjust spacings w.r.t. figsize
 
     #save plot
-    plt.rcParams['savefig.facecolor']='white'                      # set background color for saving, standard is transparent
     if filename is not None:
-        plt.savefig(f'{filename}.png')  # change name accordingly
+        figure.savefig(f'{filename}.png', facecolor='white')       # background color for saving, standard is transparent
 
-    plt.show()
+    if not headless:
+        import matplotlib.pyplot as plt
+        plt.show()
+    return figure
 
 def eng(values):
     strings = []
     try:
         for value in iter(values):
-            strings.append(EngFormatter(sep="", places=1).format_eng(value))
+            strings.append(_eng(value))
         return strings
     except TypeError:
-        return EngFormatter(sep="", places=1).format_eng(values)
+        return _eng(values)
+
+_prefixes = {-30: 'q', -27: 'r', -24: 'y', -21: 'z', -18: 'a', -15: 'f', -12: 'p', -9: 'n', -6: 'µ', -3: 'm',
+             0: '', 3: 'k', 6: 'M', 9: 'G', 12: 'T', 15: 'P', 18: 'E', 21: 'Z', 24: 'Y', 27: 'R', 30: 'Q'}
+
+def _eng(value, places=1):
+    '''value with engineering prefix like matplotlib.ticker.EngFormatter(sep="", places=1).format_eng, e.g. 1.2n
+    '''
+    value = float(value) or 0.0  # no -0.0
+    pow10 = int(math.floor(math.log10(abs(value)) / 3) * 3) if value != 0 else 0
+    pow10 = min(max(pow10, -30), 30)
+    mantissa = value / 10.0**pow10
+    if abs(float(f'{mantissa:.{places}f}')) >= 1000 and pow10 < 30:  # rounds up to the next prefix, e.g. 999.96 -> 1.0k
+        mantissa /= 1000
+        pow10 += 3
+    return f'{mantissa:.{places}f}{_prefixes[pow10]}'
 
 def iterable(object):
     '''make object iterable if not already
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# developed & tested with Python 3.9
+
+"""Loaders for time series: raw binary & .npy via memory map, chunked binary & CSV readers
+
+Memory maps are handed to nsd.get without copying, it reads them block by block (nsd.periodogram_sum), the chunk
+readers feed nsd_stream. Scaling a memory map (value = sample * scale + offset), dtype conversions and
+nsd.get(..., cascade) do make a float64 copy, for series larger than memory use the chunk readers & nsd_stream.
+"""
+
+import itertools
+import numpy as np
+import nsd_profile
+
+
+def memmap_binary(path: str, dtype=np.int16, header: int=0, count: int=-1):
+    """Memory map a raw binary file of samples
+
+    Parameters:
+    -----------
+    path : str
+        file name
+
+    dtype : data-type, optional
+        sample format, e.g. np.int16, np.int32, np.float32, np.float64, with byte order if not native, e.g. '>i4'
+        default: np.int16
+
+    header : int, optional
+        number of bytes to skip at the beginning of the file
+        default: 0
+
+    count : int, optional
+        number of samples, -1 for all
+        default: -1
+
+    Returns
+    -------
+    out : np.memmap
+        read-only, not scaled raw samples
+    """
+    shape = None if count < 0 else (count,)
+    return np.memmap(path, dtype=dtype, mode='r', offset=header, shape=shape)
+
+def memmap_npy(path: str):
+    """Memory map a .npy file
+
+    Parameters:
+    -----------
+    path : str
+        file name
+
+    Returns
+    -------
+    out : np.memmap
+        read-only samples
+    """
+    return np.load(path, mmap_mode='r')
+
+def chunks(values: tuple, chunk_size: int=2**20, scale: float=1.0, offset: float=0.0, dtype=np.float64):
+    """Scaled chunks of an array, e.g. a memory map of raw ADC counts
+
+    Only one chunk is converted at a time: value = raw * scale + offset
+
+    Parameters:
+    -----------
+    values : array_like
+        raw samples
+
+    chunk_size : int, optional
+        number of samples per chunk
+        default: 2**20
+
+    scale : float, optional
+        default: 1.0
+
+    offset : float, optional
+        default: 0.0
+
+    dtype : data-type, optional
+        data-type of the chunks
+        default: np.float64
+
+    Yields
+    ------
+    out : array
+        scaled chunk of the time series
+    """
+    for start in range(0, len(values), chunk_size):
+        with nsd_profile.stage('load'):  # per chunk, the processing between the chunks is not part of the stage
+            chunk = np.asarray(values[start:start + chunk_size], dtype=dtype)
+            if scale != 1.0:
+                chunk *= scale
+            if offset != 0.0:
+                chunk += offset
+        yield chunk
+
+def binary_chunks(path: str, dtype=np.int16, scale: float=1.0, offset: float=0.0, header: int=0, chunk_size: int=2**20):
+    """Scaled chunks of a raw binary file, see memmap_binary & chunks
+
+    Yields
+    ------
+    out : array
+        scaled chunk of the time series as float64
+    """
+    return chunks(memmap_binary(path, dtype, header), chunk_size, scale, offset)
+
+def csv_chunks(
+    path: str,
+    column: int=0,
+    sep: str=',',
+    skiprows: int=1,
+    chunk_size: int=2**20,
+    scale: float=1.0,
+    offset: float=0.0,
+    encoding: str='latin1',
+):
+    """Chunked CSV reader, one column is parsed chunk by chunk
+
+    Parameters:
+    -----------
+    path : str
+        file name
+
+    column : int, optional
+        which column has the values, 1st = 0
+        default: 0
+
+    sep : str, optional
+        column separator
+        default: ','
+
+    skiprows : int, optional
+        number of header rows
+        default: 1
+
+    chunk_size : int, optional
+        number of rows per chunk
+        default: 2**20
+
+    scale, offset : float, optional
+        value = raw * scale + offset
+        default: 1.0, 0.0
+
+    encoding : str, optional
+        default: 'latin1'
+
+    Yields
+    ------
+    out : array
+        chunk of the time series as float64
+    """
+    with open(path, 'r', encoding=encoding) as file:
+        lines = itertools.islice(file, skiprows, None)
+        while True:
+            with nsd_profile.stage('load'):
+                rows = list(itertools.islice(lines, chunk_size))
+                if not rows:
+                    break
+                chunk = np.loadtxt(rows, delimiter=sep, usecols=column, ndmin=1)
+                if scale != 1.0:
+                    chunk *= scale
+                if offset != 0.0:
+                    chunk += offset
+            yield chunk
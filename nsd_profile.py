@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# developed & tested with Python 3.9
+
+"""Opt-in instrumentation of nsd & nsd_helper: stage timers, peak memory, counters and FFT sizes
+
+    with nsd_profile.Profile(memory=True) as profile:
+        nsd_values = nsd.smooth(nsd.get(ts_values, sample_frequency), 64)
+    print(profile.summary())
+
+Without an active Profile stage() returns a shared no-op context and count() returns immediately,
+so the instrumented functions pay one list check per call.
+"""
+
+import time
+import functools
+import contextlib
+import tracemalloc
+
+_profiles = []
+_null = contextlib.nullcontext()
+
+
+def active() -> bool:
+    """True if a Profile is recording"""
+    return bool(_profiles)
+
+def stage(name: str):
+    """Context manager timing a stage in all active profiles, nested stages are reported as 'outer/inner'"""
+    if not _profiles:
+        return _null
+    return _Stage(name)
+
+def staged(name: str):
+    """Decorator timing every call of a function as stage name, see stage()"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _profiles:
+                return function(*args, **kwargs)
+            with _Stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@contextlib.contextmanager
+def paused():
+    """Context manager: the active profiles do not record the calls within, e.g. a calibration run"""
+    profiles = _profiles[:]
+    _profiles.clear()
+    try:
+        yield
+    finally:
+        _profiles[:0] = profiles
+
+def count(name: str, value: int=1):
+    """Add value to the counter name, e.g. segments averaged or bins produced"""
+    for profile in _profiles:
+        profile.counters[name] = profile.counters.get(name, 0) + value
+
+def fft_size(length: int, transforms: int=1):
+    """Record transforms FFTs of length"""
+    for profile in _profiles:
+        profile.fft_sizes[length] = profile.fft_sizes.get(length, 0) + transforms
+
+
+class _Stage:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.profiles = tuple(_profiles)  # a profile started within the stage does not record it
+        for profile in self.profiles:
+            profile._enter(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        for profile in self.profiles:
+            profile._exit(seconds)
+        return False
+
+
+class Profile:
+    """Records the stages, counters and FFT sizes of all instrumented calls while active (context manager)
+
+    Parameters:
+    -----------
+
+    memory : bool, optional
+        sample the peak traced memory per stage with tracemalloc, slows down allocations
+        default: False
+
+    callback : function(event: dict), optional
+        called at the end of every stage with {'stage', 'seconds', 'peak_bytes'}, e.g. to log stage timings
+        default: None
+    """
+
+    def __init__(self, memory: bool=False, callback=None):
+        self.memory = memory
+        self.callback = callback
+        self.stages = {}
+        self.counters = {}
+        self.fft_sizes = {}
+        self.seconds = 0.0
+        self._path = []
+        self._peaks = []
+
+    def __enter__(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        else:
+            self._tracing = False
+        self._start = time.perf_counter()
+        _profiles.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _profiles.remove(self)
+        self.seconds += time.perf_counter() - self._start
+        if self._tracing:
+            tracemalloc.stop()
+        return False
+
+    def _enter(self, name):
+        self._path.append(name)
+        if self.memory:
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._peaks.append(0)
+
+    def _exit(self, seconds):
+        path = '/'.join(self._path)
+        self._path.pop()
+        record = self.stages.setdefault(path, {'calls': 0, 'seconds': 0.0, 'peak_bytes': None})
+        record['calls'] += 1
+        record['seconds'] += seconds
+        peak = None
+        if self.memory:
+            peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+            record['peak_bytes'] = max(record['peak_bytes'] or 0, peak)
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+        if self.callback is not None:
+            self.callback({'stage': path, 'seconds': seconds, 'peak_bytes': peak})
+
+    def merge(self, report: dict):
+        """Add a report() of another profile, e.g. from a worker process"""
+        self.seconds += report['seconds']
+        for path, other in report['stages'].items():
+            record = self.stages.setdefault(path, {'calls': 0, 'seconds': 0.0, 'peak_bytes': None})
+            record['calls'] += other['calls']
+            record['seconds'] += other['seconds']
+            if other['peak_bytes'] is not None:
+                record['peak_bytes'] = max(record['peak_bytes'] or 0, other['peak_bytes'])
+        for name, value in report['counters'].items():
+            self.counters[name] = self.counters.get(name, 0) + value
+        for length, transforms in report['fft_sizes'].items():
+            self.fft_sizes[length] = self.fft_sizes.get(length, 0) + transforms
+
+    def report(self) -> dict:
+        """Structured report: total seconds, stages {path: calls, seconds, peak_bytes}, counters, fft_sizes {length: count}"""
+        return {
+            'seconds': self.seconds,
+            'stages': {path: dict(record) for path, record in self.stages.items()},
+            'counters': dict(self.counters),
+            'fft_sizes': dict(sorted(self.fft_sizes.items())),
+        }
+
+    def summary(self) -> str:
+        """Report as text table, one line per stage"""
+        lines = [f'{"stage":40} {"calls":>6} {"seconds":>10} {"peak MiB":>9}']
+        for path, record in self.stages.items():
+            peak = '' if record['peak_bytes'] is None else f'{record["peak_bytes"] / 2**20:9.1f}'
+            lines.append(f'{path:40} {record["calls"]:6} {record["seconds"]:10.4f} {peak:>9}')
+        lines.append('counters: ' + ', '.join(f'{name}={value}' for name, value in self.counters.items()))
+        lines.append('fft sizes: ' + ', '.join(f'{length}x{count}' for length, count in sorted(self.fft_sizes.items())))
+        return '\n'.join(lines)
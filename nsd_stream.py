@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# developed & tested with Python 3.9
+
+"""Streaming estimation of the noise amplitude spectral density (NSD) for time series larger than RAM"""
+
+import os
+import json
+import tempfile
+import numpy as np
+from scipy import fft
+import nsd
+
+
+class Accumulator:
+    """Welch NSD accumulated chunk by chunk
+
+    The time series is pushed in chunks of any size. Only the overlapping tail of the last chunk is kept
+    between pushes, the averaged periodogram is accumulated incrementally. Memory is bounded by the
+    chunk size plus a few segment lengths, the result matches nsd.get for the same window_function,
+    nsd_bins and crop.
+
+    Parameters:
+    -----------
+
+    sample_frequency : int/float
+        The sample frequency in Hz (SPS - Samples per second)
+
+    nsd_bins : int
+        number of NSD bins (samples per segment), required as the length of the series is not known in advance
+
+    window_function : function(length: int), optional
+        see nsd.get
+        default: nsd.window_HFT90D
+
+    crop : slice, optional
+        default: the last and the first 3 NSD values are dropped as they are not reliable
+    """
+
+    def __init__(self, sample_frequency: float, nsd_bins: int, window_function=nsd.window_HFT90D, crop=np.s_[3:-1]):
+        self.sample_frequency = sample_frequency
+        self.nsd_bins = nsd_bins
+        self.window_function = window_function
+        self.crop = crop
+        self.noverlap, self.window = nsd.cached_window(window_function, nsd_bins)
+        self.psd_sum = np.zeros(nsd_bins//2 + 1)
+        self.segments = 0
+        self.tail = np.empty(0)
+
+    def push(self, values: tuple):
+        """Add the next chunk of the time series
+
+        Parameters:
+        -----------
+        values : array_like
+            next samples of the time series
+
+        Returns
+        -------
+        out : Accumulator
+            self
+        """
+        values = np.concatenate((self.tail, np.asarray(values, dtype=float)))
+        if len(values) >= self.nsd_bins:
+            psd_sum, count = nsd.periodogram_sum(values, self.sample_frequency, self.window, self.noverlap)
+            self.psd_sum += psd_sum
+            self.segments += count
+            values = values[count * (self.nsd_bins - self.noverlap):]
+        self.tail = values.copy()
+        return self
+
+    def update(self, chunks):
+        """Add all chunks of an iterable, e.g. a generator or a file reader
+
+        Parameters:
+        -----------
+        chunks : iterable of array_like
+
+        Returns
+        -------
+        out : Accumulator
+            self
+        """
+        for chunk in chunks:
+            self.push(chunk)
+        return self
+
+    def get(self):
+        """NSD of all samples pushed so far
+
+        Returns
+        -------
+        out : [array, array]
+            The frequencies (index 0) and the corresponding NSD values (index 1)
+        """
+        if self.segments == 0:
+            raise ValueError(f'not enough samples for one segment of {self.nsd_bins} samples')
+        frequencies = fft.rfftfreq(self.nsd_bins, 1 / self.sample_frequency)
+        return (frequencies[self.crop], (self.psd_sum / self.segments)[self.crop]**0.5)
+
+    def save(self, path: str):
+        """Save the state (periodogram sum, segment count, overlap tail & parameters) to a .npz file
+
+        The file is written to a temporary file first and then replaced, an interrupted save keeps the previous state.
+        """
+        parameters = {
+            'sample_frequency': float(self.sample_frequency),  # plain Python numbers, json rejects numpy scalars
+            'nsd_bins': int(self.nsd_bins),
+            'window_function': f'{self.window_function.__module__}.{self.window_function.__qualname__}',
+            'crop': [None if value is None else int(value) for value in (self.crop.start, self.crop.stop, self.crop.step)],
+        }
+        file, temporary = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(file, 'wb') as output:
+                np.savez(output, parameters=json.dumps(parameters), psd_sum=self.psd_sum, segments=self.segments,
+                         tail=self.tail)
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+        return self
+
+    @classmethod
+    def load(cls, path: str, window_function=None):
+        """Accumulator from a state file of save(), to append new samples with push()/update()
+
+        Parameters:
+        -----------
+        path : str
+            file name
+
+        window_function : function(length: int), optional
+            needed for window functions outside of nsd, checked against the saved name
+            default: None, the nsd window function of the saved name
+
+        Returns
+        -------
+        out : Accumulator
+        """
+        with np.load(path) as data:
+            parameters = json.loads(str(data['parameters']))
+            name = parameters['window_function']
+            if window_function is None:
+                module, _, function_name = name.rpartition('.')
+                if module != nsd.__name__ or not hasattr(nsd, function_name):
+                    raise ValueError(f'window function {name} needs to be given')
+                window_function = getattr(nsd, function_name)
+            elif f'{window_function.__module__}.{window_function.__qualname__}' != name:
+                raise ValueError(f'window function does not match the saved {name}')
+            accumulator = cls(parameters['sample_frequency'], parameters['nsd_bins'], window_function,
+                              slice(*parameters['crop']))
+            accumulator.psd_sum = data['psd_sum']
+            accumulator.segments = int(data['segments'])
+            accumulator.tail = data['tail']
+        return accumulator
+
+
+def get(
+    chunks,
+    sample_frequency: float,
+    nsd_bins: int,
+    window_function=nsd.window_HFT90D,
+    crop=np.s_[3:-1],
+):
+    """Estimation of the NSD of a time series given in chunks, see nsd.get & Accumulator
+
+    Parameters:
+    -----------
+
+    chunks : iterable of array_like
+        Time series of the signal (amplitude) in chunks, e.g. a generator or a file reader
+
+    sample_frequency : int/float
+        The sample frequency in Hz (SPS - Samples per second)
+
+    nsd_bins : int
+        number of NSD bins (samples per segment)
+
+    window_function : function(length: int), optional
+        default: nsd.window_HFT90D
+
+    crop : slice, optional
+        default: the last and the first 3 NSD values are dropped as they are not reliable
+
+    Returns
+    -------
+    out : [array, array]
+        The frequencies (index 0) and the corresponding NSD values (index 1)
+    """
+    return Accumulator(sample_frequency, nsd_bins, window_function, crop).update(chunks).get()
+
+
+def append(
+    path: str,
+    chunks,
+    sample_frequency: float,
+    nsd_bins: int,
+    window_function=nsd.window_HFT90D,
+    crop=np.s_[3:-1],
+):
+    """Append new chunks of a growing capture to a persistent NSD state file, see Accumulator.save
+
+    Only the new samples are processed, e.g. each day's data of a weeks long drift campaign.
+    The state file is created if missing, its parameters need to match.
+
+    Parameters:
+    -----------
+
+    path : str
+        state file (.npz)
+
+    chunks : iterable of array_like
+        new samples of the time series, continuing the previous ones
+
+    sample_frequency, nsd_bins, window_function, crop :
+        see get
+
+    Returns
+    -------
+    out : Accumulator
+        updated & saved, get() returns the NSD of all samples so far
+    """
+    if os.path.exists(path):
+        accumulator = Accumulator.load(path, window_function)
+        if (accumulator.sample_frequency, accumulator.nsd_bins, accumulator.crop) != (sample_frequency, nsd_bins, crop):
+            raise ValueError(f'{path} has sample_frequency {accumulator.sample_frequency}, nsd_bins {accumulator.nsd_bins}'
+                             f' & crop {accumulator.crop}')
+    else:
+        accumulator = Accumulator(sample_frequency, nsd_bins, window_function, crop)
+    return accumulator.update(chunks).save(path)
+
+
+class NSDMonitor:
+    """Real-time NSD of live data, updated incrementally from a preallocated ring buffer
+
+    Each push() only transforms the segments completed by the new samples, the average periodogram is updated
+    as running mean over all segments, as mean over the last averages segments or exponentially weighted.
+    The cost per new sample is constant, independent of the length of the history.
+
+    Parameters:
+    -----------
+
+    sample_frequency : int/float
+        The sample frequency in Hz (SPS - Samples per second)
+
+    nsd_bins : int
+        number of NSD bins (samples per segment)
+
+    window_function : function(length: int), optional
+        see nsd.get
+        default: nsd.window_HFT90D
+
+    crop : slice, optional
+        default: the last and the first 3 NSD values are dropped as they are not reliable
+
+    averages : int, optional
+        average over the last averages segments (sliding window)
+        default: None, all segments
+
+    alpha : float, optional
+        weight of the newest segment for an exponentially weighted average, overrides averages
+        default: None
+    """
+
+    def __init__(
+        self,
+        sample_frequency: float,
+        nsd_bins: int,
+        window_function=nsd.window_HFT90D,
+        crop=np.s_[3:-1],
+        averages: int=None,
+        alpha: float=None,
+    ):
+        self.sample_frequency = sample_frequency
+        self.nsd_bins = nsd_bins
+        self.crop = crop
+        self.averages = averages
+        self.alpha = alpha
+        self.noverlap, self.window = nsd.cached_window(window_function, nsd_bins)
+        self.frequencies = fft.rfftfreq(nsd_bins, 1 / sample_frequency)
+        self.buffer = np.zeros(nsd_bins)
+        self.position = 0
+        self.pending = nsd_bins
+        self.psd = np.zeros(nsd_bins//2 + 1)
+        self.segments = 0
+        if alpha is None and averages is not None:
+            self.history = np.zeros((averages, nsd_bins//2 + 1))
+
+    def push(self, samples: tuple):
+        """Add new samples, completed segments are transformed & averaged
+
+        Parameters:
+        -----------
+        samples : array_like
+            new samples of the time series
+
+        Returns
+        -------
+        out : NSDMonitor
+            self
+        """
+        samples = np.asarray(samples, dtype=float)
+        while len(samples):
+            count = min(self.pending, len(samples))
+            first = min(count, self.nsd_bins - self.position)
+            self.buffer[self.position:self.position + first] = samples[:first]
+            self.buffer[:count - first] = samples[first:count]
+            self.position = (self.position + count) % self.nsd_bins
+            self.pending -= count
+            samples = samples[count:]
+            if self.pending == 0:
+                segment = np.concatenate((self.buffer[self.position:], self.buffer[:self.position]))
+                self._add(nsd.periodograms(segment, self.window, self.sample_frequency))
+                self.pending = self.nsd_bins - self.noverlap
+        return self
+
+    def _add(self, psd):
+        if self.alpha is not None:
+            if self.segments == 0:
+                self.psd[:] = psd
+            else:
+                self.psd += self.alpha * (psd - self.psd)
+        elif self.averages is not None:
+            index = self.segments % self.averages
+            self.psd -= self.history[index]
+            self.history[index] = psd
+            self.psd += psd
+            if index == self.averages - 1:
+                self.psd = self.history.sum(axis=0)  # no drift of the running sum
+        else:
+            self.psd += psd
+        self.segments += 1
+
+    def snapshot(self):
+        """Current NSD
+
+        Returns
+        -------
+        out : [array, array]
+            The frequencies (index 0) and the corresponding NSD values (index 1)
+        """
+        if self.segments == 0:
+            raise ValueError(f'not enough samples for one segment of {self.nsd_bins} samples')
+        if self.alpha is not None:
+            psd = self.psd
+        elif self.averages is not None:
+            psd = self.psd / min(self.segments, self.averages)
+        else:
+            psd = self.psd / self.segments
+        return (self.frequencies[self.crop], psd[self.crop]**0.5)
@@ -4,7 +4,21 @@
 
 import unittest
 import nsd
+import nsd_stream
+import nsd_io
+import nsd_helper
+import nsd_cache
+import nsd_cli
+import nsd_profile
+import nsd_async
+import os
+import asyncio
+import csv
+import sys
+import subprocess
+import tempfile
 import numpy as np
+from scipy import signal
 import colorednoise as cn
 
 class Test_test_NSD(unittest.TestCase):
@@ -17,23 +31,23 @@ class Test_test_NSD(unittest.TestCase):
 		beta = 0 # the exponent
 		samples = 2**18 # number of samples to generate
 		gaussian_noise = cn.powerlaw_psd_gaussian(beta, samples)
-		gn_rms = NSD.series_rms(gaussian_noise)
+		gn_rms = nsd.series_rms(gaussian_noise)
 
-		NSD.fs = 1
-		nsd_gaussian_noise = NSD.nsd(gaussian_noise, NSD.fs)
-		nsd_gn_rms = NSD.nsd_to_rms(nsd_gaussian_noise)
+		fs = 1
+		nsd_gaussian_noise = nsd.get(gaussian_noise, fs)
+		nsd_gn_rms = nsd.nsd_rms(nsd_gaussian_noise)
 
 		#plotnsd(nsd_gaussian_noise[0], nsd_gaussian_noise[1])
-		self.assertAlmostEqual(gn_rms, nsd_gn_rms, delta=0.01) # to 1% due to inaccuracies
-		print(f'RMS Deltafactor fs {NSD.fs}Hz: {nsd_gn_rms/gn_rms-1}')
+		self.assertAlmostEqual(gn_rms, nsd_gn_rms, delta=0.03) # to 3% due to inaccuracies, the cropped low bins & the bias of averaged NSD
+		print(f'RMS Deltafactor fs {fs}Hz: {nsd_gn_rms/gn_rms-1}')
 
-		NSD.fs = 1E3
-		nsd_gaussian_noise = NSD.nsd(gaussian_noise, NSD.fs)
-		nsd_gn_rms = NSD.nsd_to_rms(nsd_gaussian_noise)
+		fs = 1E3
+		nsd_gaussian_noise = nsd.get(gaussian_noise, fs)
+		nsd_gn_rms = nsd.nsd_rms(nsd_gaussian_noise)
 
 		#plotnsd(nsd_gaussian_noise[0], nsd_gaussian_noise[1])
-		self.assertAlmostEqual(gn_rms, nsd_gn_rms, delta=0.01) # to 1% due to inaccuracies
-		print(f'RMS Deltafactor fs {NSD.fs}Hz: {nsd_gn_rms/gn_rms-1}')
+		self.assertAlmostEqual(gn_rms, nsd_gn_rms, delta=0.03) # to 3% due to inaccuracies, the cropped low bins & the bias of averaged NSD
+		print(f'RMS Deltafactor fs {fs}Hz: {nsd_gn_rms/gn_rms-1}')
 
 	def test_tones(self):
 		rms = 1
@@ -43,20 +57,16 @@ class Test_test_NSD(unittest.TestCase):
 		
 		#plot(tone)
 
-		NSD.fs = 10
-		NSD.nperseg = 2**12 # 2**12=4096
-		NSD.noverlap = NSD.nperseg * 0.85
-		NSD.window = NSD.window_dpss(2**13)
-		#nsd_tones = NSD.nsd(tone, NSD.fs)
-		nsd_tones = NSD.nsd_HFT90D(tone, NSD.fs, NSD.nperseg)
-		#nsd_HFT90D(values, fs, n_fft)
+		fs = 10
+		nsd_bins = 2**12 # 2**12=4096
+		nsd_tones = nsd.get(tone, fs, nsd_bins)
 		#nsd_index =	np.where(nsd_tones[0] == frequency)#[0][0]
 
 		#get rms value of input
-		tone_rms = NSD.series_rms(tone)
+		tone_rms = nsd.series_rms(tone)
 		
 		#get rms value from NSD
-		nsd_rms = NSD.nsd_to_rms(nsd_tones)
+		nsd_rms = nsd.nsd_rms(nsd_tones)
 
 		#plot(nsd_tones[0])
 		#plot(nsd_tones[1])
@@ -69,19 +79,16 @@ class Test_test_NSD(unittest.TestCase):
 		
 		#plot(tone)
 
-		NSD.fs = 10000
-		NSD.nperseg = 2**16 #4096
-		NSD.noverlap = NSD.nperseg * 0.85
-		NSD.window = NSD.window_dpss(NSD.nperseg)
-		nsd_tones = NSD.nsd(two_tones, NSD.fs)
-		#nsd_tones = NSD.nsd_HFT90D(two_tones, NSD.fs, NSD.nperseg)
+		fs = 10000
+		nsd_bins = 2**16 #4096
+		nsd_tones = nsd.get(two_tones, fs, nsd_bins)
 		#nsd_index =	np.where(nsd_tones[0] == frequency)#[0][0]
 
 		#get rms value of input
-		tone_rms = NSD.series_rms(two_tones)
+		tone_rms = nsd.series_rms(two_tones)
 		
 		#get rms value from NSD
-		nsd_rms = NSD.nsd_to_rms(nsd_tones)
+		nsd_rms = nsd.nsd_rms(nsd_tones)
 
 		#plot(nsd_tones[0])
 		#plot(nsd_tones[1])
@@ -89,6 +96,534 @@ class Test_test_NSD(unittest.TestCase):
 		#self.assertAlmostEqual(tone_rms, nsd_rms, delta=0.01) # to 1% due to inaccuracies
 		print(f'RMS Deltafactor: {nsd_rms/tone_rms-1}')
 
+	def test_stream(self):
+		samples = 2**16
+		nsd_bins = 2**12
+		ts_values = cn.powerlaw_psd_gaussian(1, samples, random_state=1)
+		nsd_values = nsd.get(ts_values, 50, nsd_bins)
+
+		rng = np.random.default_rng(1)
+		splits = np.sort(rng.integers(0, samples, 20))
+		nsd_stream_values = nsd_stream.get(np.split(ts_values, splits), 50, nsd_bins)
+
+		np.testing.assert_allclose(nsd_stream_values[0], nsd_values[0])
+		np.testing.assert_allclose(nsd_stream_values[1], nsd_values[1], rtol=1e-9)
+
+	def test_io(self):
+		samples = 2**15
+		nsd_bins = 2**11
+		scale = 1e-6
+		raw = (cn.powerlaw_psd_gaussian(0, samples, random_state=2) * 1000).astype(np.int16)
+		nsd_values = nsd.get(raw * scale, 50, nsd_bins)
+
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, 'raw.bin')
+			raw.tofile(path)
+			nsd_binary = nsd_stream.get(nsd_io.binary_chunks(path, np.int16, scale, chunk_size=5000), 50, nsd_bins)
+			np.testing.assert_allclose(nsd_binary[1], nsd_values[1], rtol=1e-9)
+
+			path = os.path.join(directory, 'raw.npy')
+			np.save(path, raw * scale)
+			nsd_npy = nsd.get(nsd_io.memmap_npy(path), 50, nsd_bins)
+			np.testing.assert_allclose(nsd_npy[1], nsd_values[1], rtol=1e-9)
+			path = os.path.join(directory, 'raw_int16.npy')
+			np.save(path, raw)
+			nsd_int16 = nsd.get(nsd_io.memmap_npy(path), 50, nsd_bins)	# read block by block, see nsd.periodogram_sum
+			np.testing.assert_allclose(nsd_int16[1] * scale, nsd_values[1], rtol=1e-9)
+
+			path = os.path.join(directory, 'raw.csv')
+			np.savetxt(path, np.column_stack((np.arange(samples), raw)), fmt='%d', delimiter=', ', header='index, value')
+			nsd_csv = nsd_stream.get(nsd_io.csv_chunks(path, column=1, scale=scale, chunk_size=3000), 50, nsd_bins)
+			np.testing.assert_allclose(nsd_csv[1], nsd_values[1], rtol=1e-9)
+
+	def test_window(self):
+		length = 1000
+		z = 2.0 * np.pi * np.arange(length) / length
+		window = 1 - 1.942604 * np.cos(z) + 1.340318 * np.cos(2 * z) - 0.440811 * np.cos(3 * z) + 0.043097 * np.cos(4 * z)
+		noverlap, window_HFT90D = nsd.window_HFT90D(length)
+		self.assertEqual(noverlap, 760)
+		np.testing.assert_allclose(window_HFT90D, window)
+
+		cached = nsd.cached_window(nsd.window_HFT90D, length)
+		self.assertIs(cached, nsd.cached_window(nsd.window_HFT90D, length))
+		self.assertFalse(cached[1].flags.writeable)
+		self.assertEqual(nsd.cached_window(nsd.window_HFT90D, length, np.float32)[1].dtype, np.float32)
+		length = nsd.cached_window_length + 1
+		uncached = nsd.cached_window(nsd.window_HFT90D, length)
+		self.assertIsNot(uncached, nsd.cached_window(nsd.window_HFT90D, length))	# large windows are not kept in memory
+		self.assertFalse(uncached[1].flags.writeable)
+
+	def test_eng(self):
+		self.assertEqual(nsd_helper.eng(1.234e-9), '1.2n')
+		self.assertEqual(nsd_helper.eng([0, -4.56e3, 999.96, 0.0009999]), ['0.0', '-4.6k', '1.0k', '999.9µ'])
+		self.assertNotIn('matplotlib', subprocess.run([sys.executable, '-c', 'import sys, nsd_helper; nsd_helper.eng(1e-9); print(sorted(sys.modules))'],
+			capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout)
+
+	def test_get_many(self):
+		channels = cn.powerlaw_psd_gaussian(1, (4, 2**14), random_state=3)
+		nsd_many = nsd.get_many(channels, 50, 2**11)
+		self.assertEqual(nsd_many[1].shape, (4, len(nsd_many[0])))
+
+		nsd_rms = nsd.nsd_rms(nsd_many)
+		smoothed = nsd.smooth(nsd_many, 32)
+		self.assertEqual(np.shape(smoothed[1]), (4, len(smoothed[0])))
+		for channel, ts_values in enumerate(channels):
+			nsd_values = nsd.get(ts_values, 50, 2**11)
+			np.testing.assert_allclose(nsd_many[1][channel], nsd_values[1])
+			self.assertAlmostEqual(nsd_rms[channel], nsd.nsd_rms(nsd_values))
+			np.testing.assert_allclose(smoothed[1][channel], nsd.smooth(nsd_values, 32)[1])
+
+	def test_smooth(self):
+		frequencies = np.arange(1, 2**12 + 1) * 0.01
+		values = np.random.default_rng(5).exponential(size=(2, len(frequencies)))
+
+		for filter_function in (np.mean, np.median):
+			smoothed = nsd.smooth((frequencies, values), 32, filter_function)
+			generic = nsd.smooth((frequencies, values), 32, lambda x: filter_function(x))
+			np.testing.assert_allclose(smoothed[0], generic[0])
+			np.testing.assert_allclose(smoothed[1], generic[1])
+			self.assertIsInstance(smoothed[1], np.ndarray)
+
+		# every frequency exactly once
+		smoothed = nsd.smooth((frequencies, np.ones(len(frequencies))), 32, np.sum)
+		self.assertEqual(smoothed[1].sum(), len(frequencies))
+
+		# empty bins at the low end are dropped
+		smoothed = nsd.smooth((frequencies, values[0]), 512)
+		self.assertLess(len(smoothed[0]), 511)
+		self.assertTrue(np.all(np.diff(smoothed[0]) > 0))
+
+		overlapped = nsd.smooth((frequencies, values[0]), 32, overlap=0.5, percentile=90)
+		generic = nsd.smooth((frequencies, values[0]), 32, lambda x: np.percentile(x, 90), overlap=0.5)
+		np.testing.assert_allclose(overlapped[1], generic[1])
+		self.assertGreater(nsd.smooth((frequencies, np.ones(len(frequencies))), 32, np.sum, overlap=0.5)[1].sum(), len(frequencies))
+
+	def test_lpsd(self):
+		samples = 2**16
+		ts_values = cn.powerlaw_psd_gaussian(0, samples, random_state=6)
+		white = (2 / 50)**0.5 * nsd.series_rms(ts_values)	# white noise NSD level
+		for window_function in (nsd.window_HFT90D, nsd.window_flattop):
+			nsd_lpsd = nsd.get_lpsd(ts_values, 50, 32, window_function)
+			self.assertEqual(len(nsd_lpsd[0]), 32)
+			np.testing.assert_allclose(nsd_lpsd[0][[0, -1]], [16 * 50 / samples, 0.45 * 50])
+			np.testing.assert_allclose(nsd_lpsd[1][8:], white, rtol=0.1)	# enough averages above the lowest points
+
+		for nsd_bins in (8, 16):	# few points: each frequency stays min_bin bins above the mean of its segment
+			self.assertAlmostEqual(np.median(nsd.get_lpsd(ts_values, 50, nsd_bins)[1]) / white, 1, delta=0.05)
+		with self.assertRaises(ValueError):
+			nsd.get_lpsd(ts_values, 50, 8, frequency_range=(1, 49))	# 6 samples per segment at 49Hz
+		nsd_all = nsd.get_lpsd(ts_values, 50, 32, max_averages=None)
+		np.testing.assert_allclose(nsd_all[1][8:], white, rtol=0.1)
+		nsd_default = nsd.get_lpsd(ts_values, 50, 32)
+		np.testing.assert_allclose(nsd_default[1][:4], nsd_all[1][:4])	# the long low frequency segments are below the cap
+		nsd_full_rate = nsd.get_lpsd(ts_values, 50, 32, decimation=None)
+		self.assertLess(abs(np.log(nsd_default[1] / nsd_full_rate[1]).mean()), 0.01)	# no bias, the decimation filter gain is corrected
+
+	def test_cascade(self):
+		ts_values = cn.powerlaw_psd_gaussian(0, 2**18, random_state=7)
+		white = (2 / 50)**0.5 * nsd.series_rms(ts_values)
+		nsd_bins = 2**10
+		nsd_values = nsd.get(ts_values, 50, nsd_bins)
+		nsd_cascade = nsd.get(ts_values, 50, nsd_bins, cascade=2, decimation=4)
+
+		self.assertTrue(np.all(np.diff(nsd_cascade[0]) > 0))
+		self.assertAlmostEqual(nsd_cascade[0][0] * 4**2, nsd_values[0][0])
+		self.assertEqual(nsd_cascade[0][-1], nsd_values[0][-1])
+		np.testing.assert_allclose(nsd.smooth(nsd_cascade, 16)[1], white, rtol=0.15)
+
+	def test_workers(self):
+		channels = cn.powerlaw_psd_gaussian(1, (2, 2**15), random_state=8)
+		nsd_values = nsd.get_many(channels, 50, 2**10)
+		for workers in (1, 2, 4):
+			nsd_parallel = nsd.get_many(channels, 50, 2**10, workers=workers)
+			np.testing.assert_array_equal(nsd_parallel[0], nsd_values[0])
+			np.testing.assert_allclose(nsd_parallel[1], nsd_values[1], rtol=1e-12)
+
+	def test_monitor(self):
+		samples = 2**15
+		nsd_bins = 2**10
+		step = nsd_bins - nsd.window_HFT90D(nsd_bins)[0]
+		ts_values = cn.powerlaw_psd_gaussian(1, samples, random_state=9)
+		splits = np.sort(np.random.default_rng(9).integers(0, samples, 50))
+
+		monitor = nsd_stream.NSDMonitor(50, nsd_bins)
+		sliding = nsd_stream.NSDMonitor(50, nsd_bins, averages=10)
+		weighted = nsd_stream.NSDMonitor(50, nsd_bins, alpha=1)
+		for chunk in np.split(ts_values, splits):
+			monitor.push(chunk)
+			sliding.push(chunk)
+			weighted.push(chunk)
+		count = monitor.segments
+		np.testing.assert_allclose(monitor.snapshot()[1], nsd.get(ts_values, 50, nsd_bins)[1], rtol=1e-9)
+		last = ts_values[(count - 10) * step:(count - 1) * step + nsd_bins]
+		np.testing.assert_allclose(sliding.snapshot()[1], nsd.get(last, 50, nsd_bins)[1], rtol=1e-9)
+		last = ts_values[(count - 1) * step:(count - 1) * step + nsd_bins]
+		np.testing.assert_allclose(weighted.snapshot()[1], nsd.get(last, 50, nsd_bins)[1], rtol=1e-9)
+
+	def test_float32(self):
+		samples = 2**18
+		ts_values = nsd_helper.nsd_noise(samples, dtype=np.float32)
+		self.assertEqual(ts_values.dtype, np.float32)
+		self.assertEqual(nsd.window_HFT90D(64, np.float32)[1].dtype, np.float32)
+		self.assertEqual(nsd.window_flattop(64, np.float32)[1].dtype, np.float32)
+
+		nsd_values = nsd.get(ts_values, 50, dtype=np.float64)
+		nsd_float32 = nsd.get(ts_values, 50, dtype=np.float32)
+		self.assertEqual(nsd_float32[1].dtype, np.float32)
+		# float32 vs float64 NSD: ~1e-5 relative (float32 rounding)
+		np.testing.assert_allclose(nsd_float32[1], nsd_values[1], rtol=1e-3)
+		self.assertLess(np.median(np.abs(nsd_float32[1] / nsd_values[1] - 1)), 1e-4)
+
+		# RMS of the series vs RMS of the NSD: float32 adds no visible deviation to float64
+		gaussian_noise = cn.powerlaw_psd_gaussian(0, samples, random_state=10)
+		gn_rms = nsd.series_rms(gaussian_noise)
+		nsd_gn_rms = nsd.nsd_rms(nsd.get(gaussian_noise, 1))
+		nsd_gn_rms_float32 = nsd.nsd_rms(nsd.get(gaussian_noise, 1, dtype=np.float32))
+		self.assertAlmostEqual(nsd_gn_rms_float32 / gn_rms, nsd_gn_rms / gn_rms, delta=1e-4)
+		self.assertAlmostEqual(gn_rms, nsd_gn_rms_float32, delta=0.03) # cropped bins are missing
+		self.assertEqual(nsd.get(ts_values, 50, 2**12, workers=2, dtype=np.float32)[1].dtype, np.float32)
+
+	def test_generators(self):
+		t = np.arange(1000) / 50
+		tones = nsd_helper.tone([1, 2], [1, 3], 50, 1000)
+		np.testing.assert_allclose(tones, 2**0.5 * (np.cos(2 * np.pi * t) + 2 * np.cos(2 * np.pi * 3 * t)), atol=1e-12)
+		chunks = [nsd_helper.tone(1, 1.3, 50, 250, np.float32, start) for start in range(0, 1000, 250)]
+		np.testing.assert_allclose(np.concatenate(chunks), nsd_helper.tone(1, 1.3, 50, 1000), atol=1e-6)
+		self.assertEqual(chunks[0].dtype, np.float32)
+
+		# sps & corner: white noise level & 1/f noise through the corner
+		corner = [1, 2e-9]
+		white = nsd_helper.nsd_noise(2**18, ['white'], sps=1000, corner=corner)
+		self.assertAlmostEqual(np.median(nsd.get(white, 1000)[1]) / corner[1], 1, delta=0.05)
+		pink = nsd.smooth(nsd.get(nsd_helper.nsd_noise(2**18, ['pink'], sps=1000, corner=corner), 1000), 32)
+		self.assertAlmostEqual(np.interp(corner[0], pink[0], pink[1]) / corner[1], 1, delta=0.1)
+
+		out = np.zeros(2**12, np.float32)
+		self.assertIs(nsd_helper.nsd_noise(2**12, out=out), out)
+		chunks = list(nsd_helper.nsd_noise_chunks(10000, 4096))
+		self.assertEqual([len(chunk) for chunk in chunks], [4096, 4096, 1808])
+
+	def test_cache(self):
+		ts_values = cn.powerlaw_psd_gaussian(1, 2**14, random_state=11)
+		with tempfile.TemporaryDirectory() as directory:
+			cache = nsd_cache.Cache(directory)
+			nsd_values = cache.get(ts_values, 50, 2**10)
+			nsd_cached = cache.get(ts_values.copy(), 50, 2**10)
+			self.assertEqual((cache.hits, cache.misses), (1, 1))
+			np.testing.assert_array_equal(nsd_cached[1], nsd.get(ts_values, 50, 2**10)[1])
+			np.testing.assert_array_equal(nsd_cached[1], nsd_values[1])
+
+			cache.get(ts_values, 50, 2**10, window_function=nsd.window_flattop)
+			cache.get(ts_values, 50, 2**11)
+			self.assertEqual(cache.misses, 3)
+			smoothed = cache.smooth(nsd_values, 32)
+			np.testing.assert_array_equal(cache.smooth(nsd_values, 32)[1], smoothed[1])
+			self.assertEqual((cache.hits, cache.misses), (2, 4))
+			upper = cache.smooth(nsd_values, 16, lambda s: np.percentile(s, 90))
+			lower = cache.smooth(nsd_values, 16, lambda s: np.percentile(s, 10))	# same qualname '<lambda>', other code
+			self.assertEqual((cache.hits, cache.misses), (2, 6))
+			np.testing.assert_array_equal(lower[1], nsd.smooth(nsd_values, 16, lambda s: np.percentile(s, 10))[1])
+			self.assertTrue(np.all(upper[1] >= lower[1]) and np.any(upper[1] > lower[1]))
+
+			cache.invalidate(cache.get_key(ts_values, 50, 2**10))
+			cache.get(ts_values, 50, 2**10)
+			self.assertEqual(cache.misses, 7)
+
+			path = cache._path(cache.get_key(ts_values, 50, 2**10))
+			with open(path, 'r+b') as file:
+				file.truncate(os.path.getsize(path) // 2)	# e.g. killed while copying the cache
+			np.testing.assert_array_equal(cache.get(ts_values, 50, 2**10)[1], nsd_values[1])
+			self.assertEqual(cache.misses, 8)
+			with self.assertRaises(Exception):	# the object array cannot be pickled
+				cache._cached('unsaveable', lambda: (np.arange(2), np.array([lambda: 0, 0], dtype=object)))
+			self.assertEqual([name for name in os.listdir(directory) if name.endswith('.tmp')], [])
+
+			cache.max_bytes = 1	# only the newest result is kept
+			cache.get(ts_values, 50, 2**9)
+			self.assertEqual(len(os.listdir(directory)), 1)
+			cache.invalidate()
+			self.assertEqual(cache.size(), 0)
+
+	def test_fit_many(self):
+		frequencies = np.geomspace(0.01, 20, 50)
+		parameters = np.array([-9.3, 0.25, -8.9])
+		step = 1e-7
+		numerical = np.column_stack([(nsd.fit_function_loglog(np.log10(frequencies), *(parameters + step * unit)) - nsd.fit_function_loglog(np.log10(frequencies), *parameters)) / step for unit in np.eye(3)])
+		np.testing.assert_allclose(nsd.fit_jacobian_loglog(np.log10(frequencies), *parameters), numerical, atol=1e-6)
+		parameters = 10**parameters
+		numerical = np.column_stack([(nsd.fit_function(frequencies, *(parameters * (1 + step * unit))) - nsd.fit_function(frequencies, *parameters)) / (step * parameters @ unit) for unit in np.eye(3)])
+		np.testing.assert_allclose(nsd.fit_jacobian(frequencies, *parameters), numerical, rtol=1e-5)
+
+		channels = np.array([nsd_helper.nsd_noise(2**17, seed=seed) for seed in range(3)])	# corner 0.1Hz at 1nV
+		nsd_many = nsd.get_many(channels, 50)
+		fits = nsd.fit_many(nsd_many)
+		self.assertEqual(fits.dtype, nsd.fit_dtype)
+		np.testing.assert_allclose(fits['corner'], 0.1, rtol=0.1)
+		np.testing.assert_allclose(fits['white'], 1e-9, rtol=0.05)
+		np.testing.assert_allclose(fits['freq_exp'], 2, rtol=0.1)
+		np.testing.assert_allclose(fits['slope'][0], nsd.fit_loglog((nsd_many[0], nsd_many[1][0]))[0][0], rtol=1e-4, atol=0)
+
+		fits_parallel = nsd.fit_many([(nsd_many[0], values) for values in nsd_many[1]], workers=2)
+		np.testing.assert_allclose(fits_parallel['corner'], fits['corner'])
+
+		fits_two = nsd.fit_many([(nsd_many[0], values) for values in nsd_many[1][:2]])	# a list of two NSDs is not stacked
+		np.testing.assert_allclose(fits_two['corner'], fits['corner'][:2])
+		failed = nsd.fit_many([(nsd_many[0][:0], nsd_many[1][0][:0]), (nsd_many[0], nsd_many[1][:2])])
+		self.assertTrue(np.all(np.isnan(failed['corner'])))
+
+	def test_timeresolved(self):
+		frame_length = 2**12
+		ts_values = cn.powerlaw_psd_gaussian(1, 10 * frame_length + 100, random_state=12)
+		times, frequencies, nsd_frames = nsd.get_timeresolved(ts_values, 50, frame_length, block_size=3 * frame_length)
+		self.assertEqual(nsd_frames.shape, (10, len(frequencies)))
+		self.assertAlmostEqual(times[1] - times[0], frame_length / 50)
+		for frame in (0, 4, 9):
+			nsd_values = nsd.get(ts_values[frame * frame_length:(frame + 1) * frame_length], 50)
+			np.testing.assert_allclose(frequencies, nsd_values[0])
+			np.testing.assert_allclose(nsd_frames[frame], nsd_values[1], rtol=1e-9)
+
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, 'frames.npy')
+			times, frequencies, nsd_smoothed = nsd.get_timeresolved(ts_values, 50, frame_length, smooth_bins=16, filename=path)
+			np.testing.assert_allclose(nsd_smoothed[4], nsd.smooth((nsd_values[0], nsd_frames[4]), 16)[1], rtol=1e-9)
+			np.testing.assert_array_equal(np.load(path), nsd_smoothed)
+			del nsd_smoothed
+
+	def test_csd(self):
+		common = cn.powerlaw_psd_gaussian(0, 2**14, random_state=13)
+		ts_values = np.stack([common + 0.5 * cn.powerlaw_psd_gaussian(1, 2**14, random_state=channel) for channel in range(3)])
+		nsd_bins = 2**10
+		frequencies, csd = nsd.get_csd(ts_values, 50, nsd_bins, block_size=3 * nsd_bins)
+		self.assertEqual(csd.shape, (3, 3, len(frequencies)))
+		noverlap, window = nsd.window_HFT90D(nsd_bins)
+		reference = signal.csd(ts_values[0], ts_values[2], 50, window=window, noverlap=noverlap, nperseg=nsd_bins)
+		np.testing.assert_allclose(csd[0, 2], reference[1][3:-1], rtol=1e-9)
+		np.testing.assert_allclose(csd[1, 1].real, nsd.get(ts_values[1], 50, nsd_bins)[1]**2, rtol=1e-9)
+		np.testing.assert_allclose(csd[2, 0], csd[0, 2].conj())
+
+		frequencies, coherence = nsd.coherence((frequencies, csd))
+		reference = signal.coherence(ts_values[0], ts_values[1], 50, window=window, noverlap=noverlap, nperseg=nsd_bins)
+		np.testing.assert_allclose(coherence[0, 1], reference[1][3:-1], rtol=1e-9)
+		np.testing.assert_allclose(np.diagonal(coherence).T, 1)
+
+	def test_confidence(self):
+		noverlap, window = nsd.window_HFT90D(2**10)
+		self.assertAlmostEqual(nsd.equivalent_averages(window, 0, 40), 40)
+		self.assertLess(nsd.equivalent_averages(window, noverlap, 40), 40)
+		self.assertGreater(nsd.equivalent_averages(window, noverlap, 40), 40 * (2**10 - noverlap) / 2**10)
+
+		# unit variance white noise: NSD (2/fs)^0.5
+		ts_values = cn.powerlaw_psd_gaussian(0, 2**16, random_state=14)
+		frequencies, nsd_values, lower, upper = nsd.get_confidence(ts_values, 50, 2**10)
+		np.testing.assert_allclose(nsd_values, nsd.get(ts_values, 50, 2**10)[1], rtol=1e-9)
+		self.assertTrue(np.all((lower < nsd_values) & (nsd_values < upper)))
+		self.assertAlmostEqual(np.mean((lower < (2 / 50)**0.5) & ((2 / 50)**0.5 < upper)), 0.95, delta=0.05)
+
+		frequencies, nsd_values, lower_bootstrap, upper_bootstrap = nsd.get_confidence(ts_values, 50, 2**10, bootstrap=200, seed=1)
+		np.testing.assert_allclose(nsd_values, nsd.get(ts_values, 50, 2**10)[1], rtol=1e-9)
+		np.testing.assert_allclose(np.median(upper_bootstrap - lower_bootstrap), np.median(upper - lower), rtol=0.3)
+		threaded = nsd.get_confidence(ts_values, 50, 2**10, bootstrap=200, seed=1, workers=3)
+		np.testing.assert_allclose(threaded[2], lower_bootstrap, rtol=1e-9)
+
+	def test_lazy_imports(self):
+		statement = 'import sys, nsd, nsd_helper; print(" ".join(sorted(sys.modules)))'
+		modules = subprocess.run([sys.executable, '-c', statement], capture_output=True, text=True, check=True,
+								 cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+		for heavy in ('scipy.signal', 'scipy.optimize', 'scipy.stats', 'matplotlib', 'colorednoise'):
+			self.assertNotIn(heavy, modules)
+
+	def test_cli(self):
+		ts_values = nsd_helper.nsd_noise(2**14, sps=50)
+		with tempfile.TemporaryDirectory() as directory:
+			np.save(os.path.join(directory, 'a.npy'), ts_values)
+			np.savetxt(os.path.join(directory, 'b.csv'), ts_values[:2**13], header='value', comments='')
+			with open(os.path.join(directory, 'c.csv'), 'w') as file:
+				file.write('value\nbroken\n')
+			np.savetxt(os.path.join(directory, 'd.csv'), ts_values[:16], header='value', comments='')	# too short to fit
+			np.save(os.path.join(directory, 'e.npy'), ts_values.reshape(2, -1))	# not 1-D
+			output = os.path.join(directory, 'summary.csv')
+			nsd_output = os.path.join(directory, 'nsd.npz')
+			for workers in ('1', '2'):
+				code = nsd_cli.main([os.path.join(directory, '?.csv'), os.path.join(directory, '*.npy'), '--sample-rate', '50',
+									 '--smooth', '32', '--workers', workers, '--output', output, '--nsd-output', nsd_output, '--quiet'])
+				self.assertEqual(code, 1)  # c.csv fails
+				with open(output) as file:
+					rows = list(csv.DictReader(file))
+				self.assertEqual([os.path.basename(row['file']) for row in rows], ['a.npy', 'b.csv', 'c.csv', 'd.csv', 'e.npy'])
+				self.assertEqual(int(rows[1]['samples']), 2**13)
+				self.assertAlmostEqual(float(rows[0]['series_rms']), nsd.series_rms(ts_values))
+				self.assertAlmostEqual(float(rows[0]['nsd_rms']), nsd.nsd_rms(nsd.get(ts_values, 50)))
+				self.assertAlmostEqual(float(rows[0]['corner']), 0.1, delta=0.05)
+				self.assertTrue(rows[2]['error'])
+				self.assertTrue(np.isnan(float(rows[3]['corner'])))
+				self.assertIn('1-D', rows[4]['error'])
+				with np.load(nsd_output) as data:
+					np.testing.assert_allclose(data['nsd_0'], nsd.smooth(nsd.get(ts_values, 50), 32)[1])
+					self.assertNotIn('nsd_2', data)
+
+	def test_average(self):
+		ts_values = cn.powerlaw_psd_gaussian(1, 2**16, random_state=15)
+		nsd_bins = 2**10
+		noverlap, window = nsd.window_HFT90D(nsd_bins)
+		reference = signal.welch(ts_values, 50, window=window, noverlap=noverlap, average='median')[1][3:-1]**0.5
+		np.testing.assert_allclose(nsd.get(ts_values, 50, nsd_bins, average='median')[1], reference, rtol=1e-9)
+
+		# spikes distort the mean, the robust averages stay at the clean NSD
+		spiky = ts_values.copy()
+		spiky[1000::20000] += 200
+		clean = nsd.get(ts_values, 50, nsd_bins)[1]
+		self.assertGreater(np.median(nsd.get(spiky, 50, nsd_bins)[1] / clean), 1.5)
+		for average in ('median', 'trimmed'):
+			self.assertAlmostEqual(np.median(nsd.get(spiky, 50, nsd_bins, average=average)[1] / clean), 1, delta=0.08)
+		self.assertTrue(np.all(nsd.get(ts_values, 50, nsd_bins, average=90)[1] > nsd.get(ts_values, 50, nsd_bins, average=10)[1]))
+
+		# streaming quantile sketch instead of the periodogram stack
+		for average in ('median', 'trimmed', 90):
+			exact = nsd.periodogram_average(ts_values, 50, window, noverlap, average)
+			sketch = nsd.periodogram_average(ts_values, 50, window, noverlap, average, block_size=2**13)
+			self.assertLess(np.median(np.abs(sketch / exact - 1)), 0.03)
+		sketch = nsd.QuantileSketch(0.25)
+		values = np.random.default_rng(15).exponential(size=(2000, 3))
+		for row in values:
+			sketch.update(row)
+		np.testing.assert_allclose(sketch.quantile, np.quantile(values, 0.25, axis=0), rtol=0.05)
+		with self.assertRaises(ValueError):
+			nsd.get(ts_values, 50, nsd_bins, average='mode')
+
+	def test_plot(self):
+		nsd_values = nsd.get(nsd_helper.nsd_noise(2**16), 50)
+		frequencies, values = nsd_helper.display_reduce(*nsd_values, columns=500)
+		self.assertLessEqual(len(frequencies), 1000)
+		self.assertTrue(np.all(np.diff(frequencies) >= 0))
+		self.assertEqual((values.min(), values.max()), (nsd_values[1].min(), nsd_values[1].max()))
+		self.assertIs(nsd_helper.display_reduce(frequencies, values, columns=500)[0], frequencies)
+
+		with tempfile.TemporaryDirectory() as directory:
+			figure = nsd_helper.plot([{'nsd': nsd_values, 'label': 'noise'}], 'test', os.path.join(directory, 'a'), headless=True)
+			self.assertIs(nsd_helper.plot([{'nsd': nsd_values, 'label': 'noise'}], 'test', os.path.join(directory, 'b'), figure=figure, headless=True), figure)
+			self.assertEqual(len(figure.axes), 1)
+			self.assertTrue(os.path.exists(os.path.join(directory, 'a.png')) and os.path.exists(os.path.join(directory, 'b.png')))
+
+	def test_profile(self):
+		ts_values = nsd_helper.nsd_noise(2**14)
+		events = []
+		with nsd_profile.Profile(memory=True, callback=events.append) as profile:
+			nsd_values = nsd.get(ts_values, 50, 2**10)
+			nsd.smooth(nsd_values, 32)
+		report = profile.report()
+		self.assertEqual(set(report['stages']), {'get', 'get/import', 'get/window', 'get/welch', 'smooth'})
+		self.assertEqual(report['stages']['get']['calls'], 1)
+		self.assertGreaterEqual(report['stages']['get']['seconds'], report['stages']['get/welch']['seconds'])
+		self.assertGreater(report['stages']['get']['peak_bytes'], ts_values.nbytes)
+		segments = (2**14 - 778) // (2**10 - 778)  # HFT90D overlap
+		self.assertEqual(report['counters']['segments'], segments)
+		self.assertEqual(report['counters']['bins'], len(nsd_values[0]))
+		self.assertEqual(report['fft_sizes'], {2**10: segments})
+		self.assertEqual([event['stage'] for event in events], ['get/import', 'get/window', 'get/welch', 'get', 'smooth'])
+
+		nsd.get(ts_values, 50, 2**10)  # not recorded without active profile
+		self.assertEqual(profile.report()['stages']['get']['calls'], 1)
+		total = nsd_profile.Profile()
+		total.merge(report)
+		total.merge(report)
+		self.assertEqual(total.report()['counters']['segments'], 2 * segments)
+
+		with nsd_profile.Profile() as streamed:	# segments & FFT sizes are recorded by the shared spectra()
+			nsd_stream.get(nsd_io.chunks(ts_values, 3000), 50, 2**10)
+			nsd.get_csd(np.vstack((ts_values, ts_values)), 50, 2**10)
+		self.assertEqual(streamed.counters['segments'], 3 * segments)
+		self.assertEqual(streamed.fft_sizes, {2**10: 3 * segments})
+		self.assertEqual(streamed.stages['load']['calls'], 6)	# one per chunk of nsd_io.chunks
+
+	def test_plan(self):
+		ts_values = cn.powerlaw_psd_gaussian(1, 4 * 10007 + 3, random_state=16)
+		plan = nsd.plan(len(ts_values), 50)
+		self.assertEqual(plan['nsd_bins'], 10000)  # nearest fast length to the prime 10007
+		self.assertEqual((plan['samples'] - plan['noverlap']) % (plan['nsd_bins'] - plan['noverlap']), 0)
+		self.assertEqual(plan['samples'] + plan['trimmed'], len(ts_values))
+		self.assertEqual(plan['segments'], (len(ts_values) - 7600) // 2400)
+		self.assertAlmostEqual(plan['resolution'], 50 / 10000)
+		self.assertGreater(plan['seconds'], 0)
+		default = nsd.fft_seconds
+		try:
+			with nsd_profile.Profile() as profile:
+				fft_seconds = nsd.calibrate()
+			self.assertEqual(profile.stages, {})	# the calibration is not recorded
+			self.assertAlmostEqual(nsd.plan(len(ts_values), 50)['seconds'], plan['seconds'] * fft_seconds / default)
+		finally:
+			nsd.fft_seconds = default
+		np.testing.assert_allclose(nsd.get(nsd.planned(ts_values, plan), 50, plan['nsd_bins'])[1], nsd.get(ts_values, 50, 10000)[1])
+
+		plan = nsd.plan(len(ts_values), 50, 2**12, mode='pad')
+		padded = nsd.planned(ts_values, plan)
+		self.assertEqual(len(padded), len(ts_values) + plan['padding'])
+		self.assertEqual((len(padded) - plan['noverlap']) % (plan['nsd_bins'] - plan['noverlap']), 0)
+		self.assertEqual(np.count_nonzero(padded[len(ts_values):]), 0)
+		with self.assertRaises(ValueError):
+			nsd.plan(len(ts_values), 50, mode='cut')
+
+	def test_state(self):
+		ts_values = nsd_helper.nsd_noise(2**16)
+		days = np.array_split(ts_values, [10000, 30001, 50000])
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, 'state.npz')
+			for day in days:
+				accumulator = nsd_stream.append(path, nsd_io.chunks(day, 3000), 50, 2**12)
+			self.assertEqual(os.listdir(directory), ['state.npz'])
+			reference = nsd.get(ts_values, 50, 2**12)
+			np.testing.assert_allclose(accumulator.get()[1], reference[1], rtol=1e-9)
+			loaded = nsd_stream.Accumulator.load(path)
+			self.assertEqual(loaded.segments, accumulator.segments)
+			self.assertIs(loaded.window_function, nsd.window_HFT90D)
+			np.testing.assert_allclose(loaded.get()[1], reference[1], rtol=1e-9)
+			with self.assertRaises(ValueError):
+				nsd_stream.append(path, [days[0]], 50, 2**10)
+			with self.assertRaises(ValueError):
+				nsd_stream.append(path, [days[0]], 50, 2**12, crop=np.s_[1:])
+			self.assertEqual(nsd_stream.Accumulator.load(path).segments, accumulator.segments)	# not appended
+			with self.assertRaises(ValueError):
+				nsd_stream.Accumulator.load(path, nsd.window_flattop)
+
+			path = os.path.join(directory, 'numpy.npz')	# parameters from numpy computations
+			numpy_parameters = nsd_stream.Accumulator(np.float64(50), np.int64(2**12), crop=np.s_[np.int64(3):np.int64(-1)])
+			numpy_parameters.update(days[:1]).save(path)
+			np.testing.assert_array_equal(nsd_stream.Accumulator.load(path).get()[1], numpy_parameters.get()[1])
+
+	def test_async(self):
+		results = []
+
+		async def consumer(result):
+			results.append(result)
+			await asyncio.sleep(0.005)  # slow consumer, the queue fills up
+
+		pipeline = nsd_async.Pipeline(50, 2**12, queue_size=2)
+		nsd_values = asyncio.run(pipeline.run(nsd_async.simulated_source(2**16, 4096), consumer))
+		ts_values = np.concatenate(list(nsd_helper.nsd_noise_chunks(2**16, 4096)))
+		np.testing.assert_allclose(nsd_values[1], nsd.get(ts_values, 50, 2**12)[1], rtol=1e-9)
+		self.assertEqual(len(results), 16)
+		self.assertEqual(results[-1]['samples'], 2**16)
+		self.assertAlmostEqual(results[-1]['fit'][4], 0.1, delta=0.05)
+		self.assertLessEqual(pipeline.max_queued, 2)
+
+		nsd_values = nsd_async.run(np.array_split(ts_values, 7), 50, 2**12, fit_bins=None)
+		np.testing.assert_allclose(nsd_values[1], nsd.get(ts_values, 50, 2**12)[1], rtol=1e-9)
+
+		def broken():
+			yield ts_values
+			raise OSError('instrument disconnected')
+		with self.assertRaises(OSError):
+			nsd_async.run(broken(), 50, 2**12)
+
+		def failing(result):
+			raise RuntimeError('display closed')
+
+		async def failing_consumer():
+			source = nsd_async.simulated_source(2**16, 4096)
+			with self.assertRaises(RuntimeError):
+				await nsd_async.Pipeline(50, 2**12, queue_size=2).run(source, failing)
+			return asyncio.all_tasks() - {asyncio.current_task()}
+		self.assertEqual(asyncio.run(failing_consumer()), set())	# the producer is cancelled & awaited
+
 def tones(rms, freq, fs):
 	# sampling interval
 	ts = 1.0/fs